@@ -0,0 +1,128 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Microbenchmark of bind_port in the F5 mechanism drivers.
+
+Binds many F5 ports with a mix of physical network layouts, with and
+without the binding decision cache, and reports calls per second, latency
+percentiles and the drivers' bind outcome counters:
+
+    python -m networking_f5_ml2.benchmark.bind --calls 10000
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+import time
+import uuid
+
+
+class FakePortContext(object):
+    """The parts of an ML2 PortContext bind_port uses."""
+
+    def __init__(self, device_owner, segments, agents):
+        self.current = {'id': str(uuid.uuid4()), 'device_owner': device_owner,
+                        'binding:vnic_type': 'normal'}
+        self.segments_to_bind = segments
+        self._agents = agents
+        self.binding = None
+
+    def host_agents(self, agent_type):
+        return [agent for agent in self._agents if agent['agent_type'] == agent_type]
+
+    def set_binding(self, segment_id, vif_type, vif_details, status=None):
+        self.binding = segment_id
+
+
+def make_contexts(calls, physical_networks, agent_type):
+    agents = [{'host': 'f5-host:agent-%d' % i, 'agent_type': agent_type, 'alive': True,
+               'configurations': {}} for i in range(2)]
+    # segment layouts repeat across networks, as for real load balancer networks
+    layouts = [['other', physical_networks[0]],
+               [physical_networks[-1]],
+               ['other', 'another', physical_networks[0]]]
+    contexts = []
+    for i in range(calls):
+        segments = [{'id': str(uuid.uuid4()), 'network_type': 'vlan',
+                     'physical_network': physnet, 'segmentation_id': 100 + i % 3900}
+                    for physnet in layouts[i % len(layouts)]]
+        contexts.append(FakePortContext('network:f5lbaasv2', segments, agents))
+    return contexts
+
+
+def run(driver, contexts):
+    latencies = []
+    start = time.time()
+    for context in contexts:
+        call_start = time.time()
+        driver.bind_port(context)
+        latencies.append(time.time() - call_start)
+    elapsed = time.time() - start
+
+    latencies.sort()
+    return {'calls': len(contexts),
+            'calls_per_second': int(len(contexts) / elapsed) if elapsed else None,
+            'p50_us': round(latencies[len(latencies) // 2] * 1e6, 1),
+            'p99_us': round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+            'bound': sum(1 for context in contexts if context.binding),
+            'cache_hits': driver.decisions.hits,
+            'metrics': driver.metrics.summary()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=10000)
+    parser.add_argument('--physical-networks', default='f5,f5-2')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    # the driver config module parses sys.argv when imported, keep the benchmark options away from it
+    sys.argv = sys.argv[:1]
+
+    from oslo_config import cfg
+
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import driver
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import metrics
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import simple_driver
+
+    physical_networks = args.physical_networks.split(',')
+    cfg.CONF.set_override('physical_networks', physical_networks, 'ml2_f5')
+
+    results = {}
+    for cache_size in (0, cfg.CONF.ml2_f5.binding_cache_size):
+        cfg.CONF.set_override('binding_cache_size', cache_size, 'ml2_f5')
+        for name, driver_class in (('f5ml2', driver.F5MechanismDriver),
+                                   ('simple_f5ml2', simple_driver.F5SimpleMechanismDriver)):
+            contexts = make_contexts(args.calls, physical_networks, f5_constants.F5_AGENT_TYPE)
+            instance = driver_class()
+            # the drivers share the registry of the process, give every run its own
+            instance.metrics = metrics.MetricsRegistry()
+            results['%s cache=%d' % (name, cache_size)] = run(instance, contexts)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    for name, result in sorted(results.items()):
+        print("%-24s %d calls, %s/s, p50 %sus, p99 %sus, %d bound, %d cache hits" % (
+            name, result['calls'], result['calls_per_second'], result['p50_us'],
+            result['p99_us'], result['bound'], result['cache_hits']))
+
+
+if __name__ == '__main__':
+    main()
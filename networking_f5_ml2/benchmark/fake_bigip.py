@@ -0,0 +1,123 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory stand-in for the F5 LBaaS iControl driver and BIG-IP VLANs.
+
+Set f5_bigip_lbaas_device_driver to
+networking_f5_ml2.benchmark.fake_bigip.FakeiControlDriver to run the agent
+against it. Every REST call sleeps for the configured latency and is counted
+per device.
+"""
+
+import collections
+
+import eventlet
+
+
+class FakeVlan(object):
+    """A net.vlans.vlan resource, loaded or out of a collection."""
+
+    def __init__(self, device, name=None, partition=None, tag=None):
+        self._device = device
+        self.name = name
+        self.partition = partition
+        self.tag = tag
+
+    def exists(self, name, partition):
+        self._device.request('exists')
+        return (partition, name) in self._device.vlans
+
+    def load(self, name, partition):
+        self._device.request('load')
+        self.name = name
+        self.partition = partition
+        self.tag = self._device.vlans[(partition, name)]
+        return self
+
+    def update(self):
+        self._device.request('update')
+        self._device.vlans[(self.partition, self.name)] = self.tag
+
+    def delete(self):
+        self._device.request('delete')
+        del self._device.vlans[(self.partition, self.name)]
+
+
+class FakeVlans(object):
+
+    def __init__(self, device):
+        self._device = device
+
+    @property
+    def vlan(self):
+        return FakeVlan(self._device)
+
+    def get_collection(self, requests_params=None):
+        self._device.request('get_collection')
+        partition = None
+        if requests_params:
+            # only the '$filter=partition+eq+<partition>' form used by the agent is understood
+            partition = requests_params['params'].rsplit('+', 1)[-1]
+
+        return [FakeVlan(self._device, name, folder, tag)
+                for (folder, name), tag in self._device.vlans.items()
+                if partition is None or folder == partition]
+
+
+class FakeNet(object):
+
+    def __init__(self, device):
+        self.vlans = FakeVlans(device)
+
+
+class FakeBigIP(object):
+    """A BIG-IP holding VLANs as {(partition, name): tag}."""
+
+    def __init__(self, hostname, latency=0.0):
+        self.hostname = hostname
+        self.latency = latency
+        self.vlans = {}
+        self.calls = collections.Counter()
+        self.net = FakeNet(self)
+
+    def request(self, call):
+        self.calls[call] += 1
+        if self.latency:
+            eventlet.sleep(self.latency)
+
+
+class FakeiControlDriver(object):
+    """Replaces the LBaaS iControlDriver, serving a fixed set of FakeBigIPs.
+
+    The devices are shared by all driver instances of the process, so a
+    benchmark can populate and inspect them around the agent.
+    """
+
+    bigips = []
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.agent_id = 'fake-bigip'
+        self.agent_host = None
+
+    @classmethod
+    def configure(cls, devices=2, latency=0.0):
+        cls.bigips = [FakeBigIP('bigip-%d.example.com' % i, latency)
+                      for i in range(devices)]
+        return cls.bigips
+
+    def get_config_bigips(self):
+        return self.bigips
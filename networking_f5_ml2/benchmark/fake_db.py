@@ -0,0 +1,110 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Synthetic Neutron database on SQLite with F5 bound ports."""
+
+import uuid
+
+from neutron.db import models_v2
+from neutron.plugins.ml2 import models as ml2_models
+import sqlalchemy as sa
+from sqlalchemy import orm
+from sqlalchemy import pool
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+
+TABLES = [models_v2.Network.__table__,
+          models_v2.Port.__table__,
+          ml2_models.NetworkSegment.__table__,
+          ml2_models.PortBindingLevel.__table__]
+
+FIRST_VLAN = 100
+
+
+class FakeNeutronDB(object):
+    """Holds the engine, a session and the ids of the generated resources."""
+
+    def __init__(self, url='sqlite://'):
+        # a single shared connection, otherwise every green thread would see its own empty in-memory DB
+        self.engine = sa.create_engine(url, poolclass=pool.StaticPool,
+                                       connect_args={'check_same_thread': False})
+        for table in TABLES:
+            table.create(self.engine, checkfirst=True)
+        self.session = orm.sessionmaker(bind=self.engine)()
+        # network id -> (tenant id, segment id)
+        self.networks = {}
+        # port id -> network id
+        self.ports = {}
+
+    def populate(self, host, ports, ports_per_network=4, foreign_ports=0,
+                 physical_network='f5'):
+        """Create networks with one VLAN segment and ports bound to host by f5ml2.
+
+        foreign_ports adds ports without F5 bindings, which a scan must skip.
+        """
+        networks, network_rows, segment_rows = [], [], []
+        for i in range(max(ports // ports_per_network, 1)):
+            network_id, segment_id = str(uuid.uuid4()), str(uuid.uuid4())
+            tenant_id = uuid.uuid4().hex
+            networks.append(network_id)
+            self.networks[network_id] = (tenant_id, segment_id)
+            network_rows.append({'id': network_id, 'tenant_id': tenant_id,
+                                 'name': 'lb-net-%d' % i, 'status': 'ACTIVE',
+                                 'admin_state_up': True})
+            segment_rows.append({'id': segment_id, 'network_id': network_id,
+                                 'network_type': 'vlan',
+                                 'physical_network': physical_network,
+                                 'segmentation_id': FIRST_VLAN + i % 3900,
+                                 'is_dynamic': False, 'segment_index': 0})
+
+        port_rows, level_rows = [], []
+        for i in range(ports + foreign_ports):
+            port_id = str(uuid.uuid4())
+            network_id = networks[i % len(networks)]
+            f5_port = i < ports
+            port_rows.append({'id': port_id,
+                              'tenant_id': self.networks[network_id][0],
+                              'name': '', 'network_id': network_id,
+                              'mac_address': 'fa:16:3e:%02x:%02x:%02x' % (
+                                  (i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff),
+                              'admin_state_up': True, 'status': 'ACTIVE',
+                              'device_id': '',
+                              'device_owner': f5_port and 'network:f5lbaasv2' or 'compute:nova'})
+            if f5_port:
+                self.ports[port_id] = network_id
+                level_rows.append({'port_id': port_id, 'host': host, 'level': 0,
+                                   'driver': f5_constants.MECH_DRIVER_NAME,
+                                   'segment_id': self.networks[network_id][1]})
+
+        with self.engine.begin() as connection:
+            connection.execute(models_v2.Network.__table__.insert(), network_rows)
+            connection.execute(ml2_models.NetworkSegment.__table__.insert(), segment_rows)
+            connection.execute(models_v2.Port.__table__.insert(), port_rows)
+            connection.execute(ml2_models.PortBindingLevel.__table__.insert(), level_rows)
+
+    def desired_vlans(self):
+        """Return {(partition, vlan name): tag} as the agent should apply it."""
+        segments = dict(self.session.query(ml2_models.NetworkSegment.network_id,
+                                           ml2_models.NetworkSegment.segmentation_id))
+        return dict((('Project_' + tenant_id, 'vlan-' + network_id[0:10]), segments[network_id])
+                    for network_id, (tenant_id, segment_id) in self.networks.items())
+
+    def reallocate_segment(self, network_id, segmentation_id):
+        """Change the VLAN of a network behind the agent's back."""
+        segment_id = self.networks[network_id][1]
+        self.session.query(ml2_models.NetworkSegment).filter_by(id=segment_id).update(
+            {'segmentation_id': segmentation_id})
+        self.session.commit()
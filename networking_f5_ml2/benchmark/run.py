@@ -0,0 +1,231 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Offline benchmark of F5NeutronAgent.
+
+Runs the agent against a synthetic SQLite Neutron DB (through the real
+plugin RPC callback, minus the message bus) and fake BIG-IPs, then reports
+cycle times, iControl calls per device and the convergence latency of a
+port_update/network_update notification storm:
+
+    python -m networking_f5_ml2.benchmark.run --ports 1000,10000,100000
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import random
+import sys
+import time
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ports', default='1000,10000,100000',
+                        help='Comma separated F5 port counts to benchmark.')
+    parser.add_argument('--ports-per-network', type=int, default=4)
+    parser.add_argument('--foreign-ports', type=float, default=1.0,
+                        help='Non-F5 ports per F5 port in the DB.')
+    parser.add_argument('--devices', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='Seconds every fake iControl REST call takes.')
+    parser.add_argument('--drift', type=float, default=0.01,
+                        help='Fraction of device VLANs seeded with a wrong tag.')
+    parser.add_argument('--storm-events', type=int, default=200)
+    parser.add_argument('--storm-rate', type=float, default=100.0,
+                        help='Notifications per second during the storm.')
+    parser.add_argument('--polling-interval', type=int, default=2)
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON.')
+    return parser.parse_args(argv)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    # the driver config module parses sys.argv when imported, keep the benchmark options away from it
+    sys.argv = sys.argv[:1]
+
+    import eventlet
+    from oslo_config import cfg
+
+    from networking_f5_ml2.benchmark import fake_bigip
+    from networking_f5_ml2.benchmark import fake_db
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import entry_point
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import f5_agent
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import rpc as f5_rpc
+
+    class _DBContext(object):
+        def __init__(self, session):
+            self.session = session
+
+    class InProcessPluginApi(f5_rpc.F5PluginApi):
+        """Serves F5PluginRpcCallback directly instead of over the message bus."""
+
+        def __init__(self, session):
+            self.callback = f5_rpc.F5PluginRpcCallback()
+            self.db_context = _DBContext(session)
+            self.calls = 0
+
+        def get_f5_ports(self, context, host, port_ids=None, marker=None, limit=None):
+            self.calls += 1
+            return self.callback.get_f5_ports(self.db_context, host, port_ids=port_ids,
+                                              marker=marker, limit=limit)
+
+    class _NullConnection(object):
+        def consume_in_threads(self):
+            pass
+
+    class BenchmarkAgent(f5_agent.F5NeutronAgent):
+        def __init__(self, db):
+            self.bench_db = db
+            f5_agent.F5NeutronAgent.__init__(self)
+
+        def setup_rpc(self):
+            self.context = None
+            self.plugin_rpc = None
+            self.state_rpc = None
+            self.f5_plugin_rpc = InProcessPluginApi(self.bench_db.session)
+            self.connection = _NullConnection()
+
+        def _report_state(self):
+            pass
+
+    entry_point.register_options()
+    cfg.CONF(args=[], project='neutron')
+    cfg.CONF.set_override('f5_bigip_lbaas_device_driver',
+                          'networking_f5_ml2.benchmark.fake_bigip.FakeiControlDriver')
+    cfg.CONF.set_override('polling_interval', args.polling_interval, 'AGENT')
+    cfg.CONF.set_override('full_sync_interval', 10 ** 9, 'AGENT')
+    cfg.CONF.set_override('snapshot_interval', 0, 'AGENT')
+    # measure the agent, not the per-device rate limit
+    cfg.CONF.set_override('device_rate_limit', 0, 'AGENT')
+    agent_host = cfg.CONF.host + ':fake-bigip'
+
+    def device_calls(bigips):
+        return dict((bigip.hostname, sum(bigip.calls.values())) for bigip in bigips)
+
+    def run_full_sync(agent, bigips):
+        before = device_calls(bigips)
+        rpc_calls = agent.f5_plugin_rpc.calls
+        agent.last_full_sync = 0
+        start = time.time()
+        port_stats = agent._process_ports(start)
+        after = device_calls(bigips)
+        return {'seconds': round(time.time() - start, 3),
+                'rpc_calls': agent.f5_plugin_rpc.calls - rpc_calls,
+                'calls_per_device': dict((h, after[h] - before[h]) for h in after),
+                'port_stats': port_stats}
+
+    def run_storm(agent, db, bigips):
+        network_ids = list(db.networks)
+        pending = {}
+        latencies = []
+
+        def storm():
+            for i in range(args.storm_events):
+                network_id = random.choice(network_ids)
+                if random.random() < 0.5:
+                    # a segment reallocation announced by network_update
+                    db.reallocate_segment(network_id, fake_db.FIRST_VLAN + random.randint(0, 3899))
+                    pending[network_id] = time.time()
+                    agent.network_update(None, network={'id': network_id})
+                else:
+                    port_id = random.choice(list(agent.network_ports[network_id]) or [None])
+                    if port_id:
+                        agent.port_update(None, port={'id': port_id, 'network_id': network_id,
+                                                      'binding:host_id': agent.agent_host,
+                                                      'binding:vif_type': f5_constants.VIF_TYPE_F5})
+                eventlet.sleep(1.0 / args.storm_rate)
+
+        def converged(network_id, desired):
+            tenant_id, segment_id = db.networks[network_id]
+            key = ('Project_' + tenant_id, 'vlan-' + network_id[0:10])
+            return all(bigip.vlans.get(key) == desired[key] for bigip in bigips)
+
+        storm_thread = eventlet.spawn(storm)
+        start = time.time()
+        iterations = 0
+        while not storm_thread.dead or pending:
+            iteration_start = time.time()
+            port_stats = agent._process_ports(iteration_start)
+            iterations += 1
+
+            desired = db.desired_vlans()
+            now = time.time()
+            for network_id, notified in list(pending.items()):
+                if converged(network_id, desired):
+                    latencies.append(now - notified)
+                    del pending[network_id]
+
+            if time.time() - start > 60 + args.storm_events / args.storm_rate:
+                break
+            agent.loop_count_and_wait(iteration_start, port_stats)
+
+        return {'events': args.storm_events,
+                'iterations': iterations,
+                'unconverged': len(pending),
+                'convergence_p50': percentile(latencies, 0.5),
+                'convergence_p99': percentile(latencies, 0.99),
+                'convergence_max': max(latencies) if latencies else None}
+
+    results = []
+    for ports in [int(p) for p in args.ports.split(',')]:
+        bigips = fake_bigip.FakeiControlDriver.configure(args.devices, args.latency)
+
+        db = fake_db.FakeNeutronDB()
+        db.populate(agent_host, ports, ports_per_network=args.ports_per_network,
+                    foreign_ports=int(ports * args.foreign_ports))
+
+        # the devices start out with every VLAN, a fraction of them with a drifted tag
+        for key, tag in db.desired_vlans().items():
+            for bigip in bigips:
+                bigip.vlans[key] = tag + 1 if random.random() < args.drift else tag
+
+        agent = BenchmarkAgent(db)
+        result = {'ports': ports, 'devices': args.devices, 'latency': args.latency}
+        result['cold_full_sync'] = run_full_sync(agent, bigips)
+        result['warm_full_sync'] = run_full_sync(agent, bigips)
+        result['storm'] = run_storm(agent, db, bigips)
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    for result in results:
+        print("%(ports)d ports, %(devices)d devices, %(latency).3fs per REST call" % result)
+        for phase in ('cold_full_sync', 'warm_full_sync'):
+            r = result[phase]
+            print("  %-15s %8.3fs  rpc calls %-5d device calls %s  tags corrected %s" % (
+                phase, r['seconds'], r['rpc_calls'], r['calls_per_device'],
+                r['port_stats'].get('tags_corrected')))
+        r = result['storm']
+        print("  storm           %d events, %d iterations, convergence p50 %s p99 %s max %s, "
+              "%d unconverged" % (r['events'], r['iterations'], r['convergence_p50'],
+                                  r['convergence_p99'], r['convergence_max'], r['unconverged']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-only drift audit of the VLANs the F5 agent reconciles.
+
+Compares the F5 bound ports of the agent host, fetched in bulk from the
+neutron server, with one VLAN listing per BIG-IP and reports missing VLANs,
+mismatched tags and orphaned VLANs. Nothing is modified, so it can run next
+to the agent. Exits 1 if drift was found and 2 if a device could not be
+audited.
+"""
+
+import csv
+import sys
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import importutils
+
+from neutron.agent.common import config
+from neutron.common import config as common_config
+from neutron import context
+from neutron.i18n import _LE
+from neutron.plugins.common import constants as p_constants
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import naming
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import rpc as f5_rpc
+
+LOG = logging.getLogger(__name__)
+
+AUDIT_OPTS = [
+    cfg.StrOpt('report-format',
+               default='json',
+               choices=['json', 'csv'],
+               help=_('Format of the drift report.')),
+    cfg.StrOpt('report-file',
+               help=_('File to write the drift report to, stdout if not '
+                      'given.')),
+]
+
+REPORT_FIELDS = ['bigip', 'partition', 'vlan', 'problem', 'expected_tag', 'device_tag']
+
+
+def get_desired_vlans(f5_plugin_rpc, admin_context, agent_host, page_size):
+    """Return ({(partition, vlan name): tag}, port count) for the agent host."""
+    desired = {}
+    ports = 0
+    for port in f5_plugin_rpc.iter_f5_ports(admin_context, agent_host, page_size=page_size):
+        ports += 1
+        if port.network_type == p_constants.TYPE_VLAN:
+            desired[(naming.vlan_folder(port.tenant_id),
+                     naming.vlan_name(port.network_id))] = port.segmentation_id
+    return desired, ports
+
+
+def diff_device(hostname, desired, inventory):
+    """Compare the desired VLANs with a device's {(partition, vlan name): tag}."""
+    problems = []
+    for (partition, name), tag in sorted(desired.items()):
+        if (partition, name) not in inventory:
+            problems.append({'bigip': hostname, 'partition': partition, 'vlan': name,
+                             'problem': 'missing', 'expected_tag': tag, 'device_tag': None})
+        elif inventory[(partition, name)] != tag:
+            problems.append({'bigip': hostname, 'partition': partition, 'vlan': name,
+                             'problem': 'mismatch', 'expected_tag': tag,
+                             'device_tag': inventory[(partition, name)]})
+
+    for (partition, name), tag in sorted(inventory.items()):
+        if naming.is_agent_vlan(partition, name) and (partition, name) not in desired:
+            problems.append({'bigip': hostname, 'partition': partition, 'vlan': name,
+                             'problem': 'orphan', 'expected_tag': None, 'device_tag': tag})
+    return problems
+
+
+def audit(conf, f5_driver, f5_plugin_rpc, admin_context, agent_host):
+    desired, ports = get_desired_vlans(f5_plugin_rpc, admin_context, agent_host,
+                                       conf.AGENT.rpc_page_size)
+
+    def fetch_inventory(bigip):
+        try:
+            with eventlet.Timeout(conf.AGENT.device_request_timeout):
+                collection = bigip.net.vlans.get_collection()
+            return dict(((v.partition, v.name), v.tag) for v in collection), None
+        except (Exception, eventlet.Timeout) as e:
+            LOG.exception(_LE("Failed listing the VLANs of %s"), bigip.hostname)
+            return None, str(e) or e.__class__.__name__
+
+    bigips = f5_driver.get_config_bigips()
+    pool = eventlet.GreenPool(conf.AGENT.device_concurrency)
+    report = {'agent_host': agent_host, 'ports': ports, 'vlans': len(desired),
+              'devices': {}, 'problems': []}
+    for bigip, (inventory, error) in zip(bigips, pool.imap(fetch_inventory, bigips)):
+        if inventory is None:
+            report['devices'][bigip.hostname] = {'error': error}
+            continue
+        problems = diff_device(bigip.hostname, desired, inventory)
+        report['devices'][bigip.hostname] = {'vlans': len(inventory), 'problems': len(problems)}
+        report['problems'].extend(problems)
+    return report
+
+
+def write_report(report, report_format, stream):
+    if report_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for problem in report['problems']:
+            writer.writerow(problem)
+    else:
+        stream.write(jsonutils.dumps(report, indent=2, sort_keys=True))
+        stream.write('\n')
+
+
+def main():
+    # The ml2_f5 config module parses the command line as soon as it is
+    # imported, which the agent modules do. Command line options cannot be
+    # registered after that, nor can unknown ones be parsed.
+    cfg.CONF.register_cli_opts(AUDIT_OPTS)
+    from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import entry_point
+    entry_point.register_options()
+
+    common_config.init(sys.argv[1:])
+
+    config.setup_logging()
+
+    f5_driver = importutils.import_object(cfg.CONF.f5_bigip_lbaas_device_driver, cfg.CONF)
+    agent_host = cfg.CONF.host + ":" + f5_driver.agent_id
+
+    report = audit(cfg.CONF, f5_driver, f5_rpc.F5PluginApi(f5_constants.F5_PLUGIN_TOPIC),
+                   context.get_admin_context_without_session(), agent_host)
+
+    if cfg.CONF.report_file:
+        with open(cfg.CONF.report_file, 'w') as stream:
+            write_report(report, cfg.CONF.report_format, stream)
+    else:
+        write_report(report, cfg.CONF.report_format, sys.stdout)
+
+    if any('error' in device for device in report['devices'].values()):
+        return 2
+    return 1 if report['problems'] else 0
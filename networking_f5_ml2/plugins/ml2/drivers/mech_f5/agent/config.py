@@ -34,5 +34,186 @@ F5_AGENT_OPTS = [
                       'Hyper-V\'s port metrics collection. The agent will try '
                       'to enable the feature once every polling_interval '
                       'period for at most metrics_max_retries or until it '
-                      'succeedes.'))
+                      'succeedes.')),
+    cfg.BoolOpt('vlan_inventory_per_partition',
+                default=False,
+                help=_('Fetch the VLAN inventory of each BIG-IP once per '
+                       'Project_<tenant> partition with bound ports instead '
+                       'of a single listing across all partitions.')),
+    cfg.IntOpt('device_concurrency',
+               default=8,
+               min=1,
+               help=_('Maximum number of BIG-IP devices reconciled in '
+                      'parallel.')),
+    cfg.IntOpt('device_request_concurrency',
+               default=4,
+               min=1,
+               help=_('Maximum number of concurrent iControl REST requests '
+                      'per BIG-IP device.')),
+    cfg.IntOpt('device_request_timeout',
+               default=30,
+               help=_('Timeout in seconds for a single iControl REST '
+                      'request.')),
+    cfg.IntOpt('full_sync_interval',
+               default=600,
+               help=_('Seconds between full resyncs of all F5 bound ports. '
+                      'In between only ports and networks reported as '
+                      'changed via RPC are reconciled.')),
+    cfg.IntOpt('vlan_cache_ttl',
+               default=900,
+               help=_('Seconds a VLAN tag verified or applied on a BIG-IP is '
+                      'trusted without reading it from the device again. '
+                      'Expired entries make the agent re-read the device, '
+                      'which catches out-of-band changes. 0 disables the '
+                      'cache.')),
+    cfg.IntOpt('rpc_page_size',
+               default=500,
+               min=1,
+               help=_('Number of F5 bound ports requested from the neutron '
+                      'server per RPC call during a scan.')),
+    cfg.FloatOpt('polling_jitter',
+                 default=0.1,
+                 help=_('Fraction of the polling and report intervals by '
+                        'which they are randomly spread, so agents do not '
+                        'poll in lockstep.')),
+    cfg.IntOpt('max_polling_interval',
+               default=60,
+               help=_('Upper bound in seconds for the polling interval when '
+                      'the agent backs off after iterations overran it.')),
+    cfg.FloatOpt('min_polling_interval',
+                 default=0.5,
+                 help=_('Minimum number of seconds between loop iterations '
+                        'when RPC notifications wake the agent early. '
+                        'Multiplied by the current backoff factor.')),
+    cfg.StrOpt('metrics_sink',
+               default='none',
+               choices=['none', 'prometheus', 'statsd'],
+               help=_('Where the agent exports its scan timings and '
+                      'counters: a Prometheus text file, a statsd daemon '
+                      'or nowhere.')),
+    cfg.StrOpt('metrics_textfile',
+               default='/var/lib/node_exporter/textfile_collector/'
+                       'neutron_f5_agent.prom',
+               help=_('File written by the prometheus metrics sink after '
+                      'every loop iteration.')),
+    cfg.StrOpt('statsd_host',
+               default='localhost',
+               help=_('Host of the statsd daemon used by the statsd metrics '
+                      'sink.')),
+    cfg.IntOpt('statsd_port',
+               default=8125,
+               help=_('UDP port of the statsd daemon.')),
+    cfg.StrOpt('statsd_prefix',
+               default='neutron.f5_agent',
+               help=_('Prefix of all metric names sent to statsd.')),
+    cfg.StrOpt('shard_member',
+               help=_('Unique name of this agent among several agents '
+                      'configured with the same host and BIG-IP devices. '
+                      'If set, the agents split the networks between them '
+                      'by consistent hashing over the live members and '
+                      'rebalance when members join or die.')),
+    cfg.IntOpt('vlan_update_batch_size',
+               default=50,
+               help=_('Maximum number of VLAN tag corrections committed to a '
+                      'BIG-IP in one iControl REST transaction. Failed '
+                      'transactions fall back to single updates. 1 disables '
+                      'transactions.')),
+    cfg.IntOpt('device_health_check_interval',
+               default=60,
+               help=_('Seconds a BIG-IP session may stay idle before it is '
+                      'health checked when handed out for a scan.')),
+    cfg.IntOpt('device_token_refresh_margin',
+               default=60,
+               help=_('Seconds before expiry at which a cached BIG-IP auth '
+                      'token is replaced by a new login.')),
+    cfg.DictOpt('network_maps',
+                default={},
+                help=_('Mapping of physical networks to the BIG-IP '
+                       'interfaces or trunks carrying them, reported to the '
+                       'neutron server. If set, the f5ml2 mechanism driver '
+                       'only binds segments of these physical networks to '
+                       'this agent.')),
+    cfg.StrOpt('snapshot_file',
+               help=_('File the agent periodically saves its reconciled '
+                      'state to and restores it from on startup. Defaults '
+                      'to a file named after the agent in state_path.')),
+    cfg.IntOpt('snapshot_interval',
+               default=60,
+               help=_('Seconds between saves of the agent snapshot. 0 '
+                      'disables the snapshot, the agent then starts with a '
+                      'full sync.')),
+    cfg.IntOpt('snapshot_max_age',
+               default=3600,
+               help=_('Snapshots older than this many seconds are ignored '
+                      'on startup and the agent starts with a full sync.')),
+    cfg.BoolOpt('orphan_vlan_gc',
+                default=False,
+                help=_('Delete vlan-* VLANs in Project_* partitions of the '
+                       'BIG-IPs whose network has no F5 bound port on this '
+                       'host anymore. Only enable it if no other agent host '
+                       'manages VLANs on the same devices.')),
+    cfg.IntOpt('orphan_vlan_grace_period',
+               default=3600,
+               help=_('Seconds a VLAN must stay orphaned across full syncs '
+                      'before it is deleted.')),
+    cfg.IntOpt('orphan_vlan_batch_size',
+               default=20,
+               help=_('Maximum number of orphaned VLANs deleted per BIG-IP '
+                      'after each full sync.')),
+    cfg.FloatOpt('orphan_vlan_delete_rate',
+                 default=1.0,
+                 help=_('Maximum number of orphaned VLAN deletions per '
+                        'second and BIG-IP.')),
+    cfg.FloatOpt('orphan_vlan_max_drop',
+                 default=0.5,
+                 help=_('Skip the VLAN garbage collection when the number of '
+                        'VLANs bound on this host dropped by more than this '
+                        'fraction since the previous full sync, or is zero. '
+                        'A drop that persists is collected after the next '
+                        'full sync.')),
+    cfg.IntOpt('device_failure_threshold',
+               default=5,
+               help=_('Consecutive failed iControl REST calls, timeouts, '
+                      'connection errors or 5xx responses, after which the '
+                      'circuit breaker of a BIG-IP opens and its calls are '
+                      'skipped.')),
+    cfg.IntOpt('device_breaker_backoff',
+               default=30,
+               help=_('Seconds an opened circuit breaker waits before '
+                      'probing the BIG-IP again. Doubles with every failed '
+                      'probe.')),
+    cfg.IntOpt('device_breaker_max_backoff',
+               default=600,
+               help=_('Upper bound in seconds for the circuit breaker '
+                      'backoff.')),
+    cfg.FloatOpt('device_rate_limit',
+                 default=20.0,
+                 help=_('Maximum number of iControl REST calls per second '
+                        'and BIG-IP. 0 disables the limit.')),
+    cfg.IntOpt('device_rate_burst',
+               default=20,
+               min=1,
+               help=_('Number of iControl REST calls a BIG-IP may receive '
+                      'at once before device_rate_limit applies.')),
+    cfg.IntOpt('network_cache_size',
+               default=4096,
+               help=_('Number of networks whose tenant and segment are '
+                      'cached, so updates of their ports are reconciled '
+                      'without asking the neutron server. 0 disables the '
+                      'cache.')),
+    cfg.IntOpt('network_cache_ttl',
+               default=600,
+               help=_('Seconds a cached network is trusted without being '
+                      'seen in a scan again. Network notifications '
+                      'invalidate entries right away.')),
+    cfg.IntOpt('profile_iterations',
+               default=10,
+               help=_('Number of loop iterations profiled after the agent '
+                      'receives SIGUSR1. Another SIGUSR1 stops profiling '
+                      'early.')),
+    cfg.StrOpt('profile_dir',
+               help=_('Directory the profile stats written after SIGUSR1 '
+                      'and the greenthread stacks dumped on SIGUSR2 go '
+                      'to. Defaults to f5-ml2-agent-diagnostics below '
+                      'state_path.')),
 ]
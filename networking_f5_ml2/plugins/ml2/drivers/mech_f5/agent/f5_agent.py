@@ -15,6 +15,9 @@
 #    under the License.
 
 import collections
+import itertools
+import os
+import random
 import signal
 import time
 
@@ -35,17 +38,31 @@ from neutron.common import constants as n_const
 from neutron.common import rpc as n_rpc
 from neutron.common import topics
 from neutron import context
+from neutron.extensions import portbindings
+from neutron.extensions import providernet
 from neutron.i18n import _LE
-from neutron.db import db_base_plugin_v2 as db_base
-from neutron.plugins.ml2 import db as db_ml2
+from neutron.plugins.common import constants as p_constants
 
 
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import naming
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import network_cache
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import profiling
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import scheduler
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import sessions
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import sharding
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import snapshot
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import throttle
 from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import metrics
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import rpc as f5_rpc
 
 from oslo_utils import importutils
 
 LOG = logging.getLogger(__name__)
 
+# f5-sdk comes with the LBaaS driver, without it tag corrections are not batched
+f5_contexts = importutils.try_import('f5.bigip.contexts')
+
 cfg.CONF.import_group('ml2_f5',
                       'networking_f5_ml2.plugins.ml2.drivers.mech_f5.config')
 
@@ -63,22 +80,57 @@ class F5NeutronAgent():
         cfg.CONF.log_opt_values(LOG, logging.DEBUG)
 
         self.agent_conf = self.conf.get('AGENT', {})
-        self.polling_interval = 10
+        self.polling_interval = self.conf.AGENT.polling_interval
+        self.scheduler = scheduler.AdaptiveScheduler(self.polling_interval,
+                                                     self.conf.AGENT.max_polling_interval,
+                                                     jitter=self.conf.AGENT.polling_jitter,
+                                                     min_interval=self.conf.AGENT.min_polling_interval)
         self.iter_num = 0
+        self.metrics = metrics.create_registry(self.conf.AGENT)
         self.run_daemon_loop = True
         self.quitting_rpc_timeout = quitting_rpc_timeout
         self.catch_sigterm = False
         self.catch_sighup = False
+        self.catch_sigusr1 = False
+        self.profiler = None
+        self.profile_dir = self.conf.AGENT.profile_dir or profiling.default_dir(self.conf.state_path)
 
         # Stores port update notifications for processing in main rpc loop
         self.updated_ports = set()
         # Stores port delete notifications
         self.deleted_ports = set()
+        # Updated ports resolved from the network cache, port id -> F5Port
+        self.resolved_ports = {}
+        self.network_cache = network_cache.NetworkCache(self.conf.AGENT.network_cache_size,
+                                                        self.conf.AGENT.network_cache_ttl)
 
         self.network_ports = collections.defaultdict(set)
+        self.last_full_sync = 0
+        # number of full syncs completed, carried over restarts by the snapshot
+        self.sync_generation = 0
+        self.scan_stats = {}
+        # VLANs wanted by the last full sync, reported as part of the agent load
+        self.managed_vlans = 0
+        # moving average of the incremental cycle times, see _update_overrun()
+        self.cycle_average = 0.0
+        self.overrunning = False
+        self.last_overrun = 0
+
+        # Last VLAN tag verified or applied, (bigip, partition, vlan name) -> (tag, timestamp)
+        self.vlan_cache = {}
+        # (partition, vlan name) of all networks bound on agent_host at the last full sync
+        self.bound_vlans = None
+        # VLANs found orphaned on the devices, (bigip, partition, vlan name) -> first seen
+        self.orphan_vlans = {}
+        # number of bound_vlans at the previous garbage collection
+        self.gc_bound_vlans = None
 
         self.local_vlan_map = {}
 
+        self.device_pool = eventlet.GreenPool(self.conf.AGENT.device_concurrency)
+        # hostname -> (circuit breaker, rate limiter) guarding all calls to a BIG-IP
+        self.device_throttles = {}
+
         self.f5_driver = importutils.import_object(cfg.CONF.f5_bigip_lbaas_device_driver, cfg.CONF)
 
         host = self.conf.host
@@ -87,43 +139,158 @@ class F5NeutronAgent():
 
         self.f5_driver.agent_host = self.agent_host
 
+        self.device_sessions = sessions.DeviceSessionPool(
+            self.f5_driver, self.metrics, self._device_request,
+            concurrency=self.conf.AGENT.device_concurrency,
+            pool_size=self.conf.AGENT.device_request_concurrency,
+            health_check_interval=self.conf.AGENT.device_health_check_interval,
+            token_refresh_margin=self.conf.AGENT.device_token_refresh_margin)
+
         self.agent_id = 'f5-agent-%s' % host
 
+        # Agents sharing agent_host report under their own name and split the networks between them
+        self.shard_member = self.agent_host
+        if self.conf.AGENT.shard_member:
+            self.shard_member = '%s#%s' % (self.agent_host, self.conf.AGENT.shard_member)
+        self.shard_ring = None
+        self.restored_shard_members = None
+
+        self.last_snapshot = 0
+        self.snapshot_file = (self.conf.AGENT.snapshot_file or
+                              snapshot.default_path(self.conf.state_path, self.shard_member))
+        if self.conf.AGENT.snapshot_interval > 0:
+            self._restore_snapshot()
+
         self.setup_rpc()
-        self.db = db_base.NeutronDbPluginV2()
 
         self.agent_state = {
             'binary': 'neutron-f5-agent',
-            'host': self.agent_host,
+            'host': self.shard_member,
             'topic': n_const.L2_AGENT_TOPIC,
-            'configurations': {},
+            'configurations': {'agent_host': self.agent_host,
+                               'network_maps': self.conf.AGENT.network_maps},
             'agent_type': f5_constants.F5_AGENT_TYPE,
             'start_flag': True}
 
         self.connection.consume_in_threads()
 
+        if self.conf.AGENT.shard_member:
+            self._refresh_shards()
+
     def port_update(self, context, **kwargs):
         port = kwargs.get('port')
-        self.updated_ports.add(port['id'])
+        if not self._is_port_relevant(port):
+            # port updates are fanned out for every port of the cloud
+            return
+
+        resolved = self._resolve_port(port, kwargs.get('segmentation_id'))
+        if resolved is None:
+            self.resolved_ports.pop(port['id'], None)
+            self.updated_ports.add(port['id'])
+        else:
+            self.updated_ports.discard(port['id'])
+            self.resolved_ports[port['id']] = resolved
+        self.scheduler.wake()
+
+    def _is_port_relevant(self, port):
+        """Whether port is bound to our agent host or already known to the agent."""
+        if port.get(portbindings.HOST_ID) == self.agent_host:
+            return True
+        return port['id'] in self.network_ports.get(port.get('network_id'), ())
 
     def port_delete(self, context, **kwargs):
         port_id = kwargs.get('port_id')
         self.deleted_ports.add(port_id)
         self.updated_ports.discard(port_id)
+        self.resolved_ports.pop(port_id, None)
 
     def network_create(self, context, **kwargs):
         pass
 
     def network_update(self, context, **kwargs):
-        network_id = kwargs['network']['id']
-        for port_id in self.network_ports[network_id]:
+        network = kwargs['network']
+        network_id = network['id']
+        info = self.network_cache.get(network_id)
+        if (info is not None and network.get('tenant_id') == info.tenant_id and
+                network.get(providernet.SEGMENTATION_ID) == info.segmentation_id):
+            # already applied from the f5_network_update cast for the same change
+            return
+
+        self.network_cache.invalidate(network_id)
+        self._unresolve_network_ports(network_id)
+        for port_id in self.network_ports.get(network_id, ()):
             # notifications could arrive out of order, if the port is deleted
             # we don't want to update it anymore
             if port_id not in self.deleted_ports:
                 self.updated_ports.add(port_id)
+        if self.updated_ports:
+            self.scheduler.wake()
 
     def network_delete(self, context, **kwargs):
-        pass
+        network_id = kwargs.get('network_id')
+        self.network_cache.invalidate(network_id)
+        self._unresolve_network_ports(network_id)
+        self.network_ports.pop(network_id, None)
+        self._evict_vlan_cache(network_id)
+
+    def f5_port_update(self, context, ports):
+        """Ports newly bound here, already resolved by the server."""
+        for row in ports:
+            port = f5_rpc.F5Port(*row)
+            self.network_cache.put(port.network_id, network_cache.NetworkInfo(
+                port.tenant_id, port.network_type, port.segmentation_id))
+            self.updated_ports.discard(port.id)
+            self.resolved_ports[port.id] = port
+        self.scheduler.wake()
+
+    def f5_port_delete(self, context, port_ids):
+        for port_id in port_ids:
+            self.port_delete(context, port_id=port_id)
+
+    def f5_network_update(self, context, network):
+        """A network with ports bound here, with its current tenant and segment."""
+        network_id = network[0]
+        info = network_cache.NetworkInfo(*network[1:])
+        self.network_cache.put(network_id, info)
+        for port_id in self.network_ports.get(network_id, ()):
+            if port_id not in self.deleted_ports:
+                self.updated_ports.discard(port_id)
+                self.resolved_ports[port_id] = f5_rpc.F5Port(port_id, network_id, *info)
+        self.scheduler.wake()
+
+    def _resolve_port(self, port, segmentation_id):
+        """Build the F5Port of an updated port from the network cache, None if the server must be asked."""
+        if (port.get(portbindings.HOST_ID) != self.agent_host or
+                port.get(portbindings.VIF_TYPE) != f5_constants.VIF_TYPE_F5):
+            return None
+
+        info = self.network_cache.get(port['network_id'])
+        if info is not None and segmentation_id is not None and segmentation_id != info.segmentation_id:
+            # we missed a segment change, do not trust the network anymore
+            self.network_cache.invalidate(port['network_id'])
+            info = None
+        self.metrics.inc('f5_agent_network_cache_total', result='miss' if info is None else 'hit')
+        if info is None:
+            return None
+        return f5_rpc.F5Port(port['id'], port['network_id'], info.tenant_id,
+                             info.network_type, info.segmentation_id)
+
+    def _unresolve_network_ports(self, network_id):
+        # ports resolved from a network that changed meanwhile have to be looked up on the server
+        for port_id, port in list(self.resolved_ports.items()):
+            if port.network_id == network_id:
+                del self.resolved_ports[port_id]
+                self.updated_ports.add(port_id)
+
+    def _cache_networks(self, f5_ports):
+        """Pass the ports through, caching the metadata of their networks."""
+        networks = set()
+        for port in f5_ports:
+            if port.network_id not in networks:
+                networks.add(port.network_id)
+                self.network_cache.put(port.network_id, network_cache.NetworkInfo(
+                    port.tenant_id, port.network_type, port.segmentation_id))
+            yield port
 
     def _clean_network_ports(self, port_id):
         for port_set in self.network_ports.values():
@@ -136,11 +303,11 @@ class F5NeutronAgent():
         LOG.info(_LI("RPC agent_id: %s"), self.agent_id)
 
         self.plugin_rpc = agent_rpc.PluginApi(topics.PLUGIN)
+        self.f5_plugin_rpc = f5_rpc.F5PluginApi(f5_constants.F5_PLUGIN_TOPIC)
         self.state_rpc = agent_rpc.PluginReportStateAPI(topics.PLUGIN)
 
         # RPC network init
         self.context = context.get_admin_context_without_session()
-        self.context_with_session = context.get_admin_context()
 
         # Define the listening consumers for the agent
         consumers = [[topics.PORT, topics.CREATE],
@@ -154,10 +321,15 @@ class F5NeutronAgent():
                                                      topics.AGENT,
                                                      consumers,
                                                      start_listening=False)
+        # compact F5 notifications cast by the mechanism drivers, fanned out to all shards of agent_host
+        self.connection.create_consumer(f5_rpc.f5_agent_topic(self.agent_host), [self], fanout=True)
 
-        report_interval = 30  # self.conf.AGENT.report_interval
-        heartbeat = loopingcall.FixedIntervalLoopingCall(self._report_state)
-        heartbeat.start(interval=report_interval)
+        report_interval = self.conf.AGENT.report_interval
+        if report_interval:
+            # a random initial delay spreads the heartbeats of a fleet of agents
+            heartbeat = loopingcall.FixedIntervalLoopingCall(self._report_state)
+            heartbeat.start(interval=report_interval,
+                            initial_delay=random.uniform(0, report_interval))
 
     def _report_state(self):
         LOG.info(_LI("******** Reporting state via rpc"))
@@ -171,6 +343,94 @@ class F5NeutronAgent():
 
             LOG.exception(_LE("Failed reporting state!"))
 
+        if self.conf.AGENT.shard_member:
+            self._refresh_shards()
+
+    def _refresh_shards(self):
+        """Rebuild the hash ring from the live agents sharing agent_host."""
+        try:
+            members = set(self.f5_plugin_rpc.get_f5_agents(self.context, self.agent_host))
+        except Exception:
+            LOG.exception(_LE("Failed fetching the agents sharing %s"), self.agent_host)
+            return
+
+        if not members:
+            # nobody reported alive yet, including us
+            members.add(self.shard_member)
+        if self.shard_ring is None and members == self.restored_shard_members:
+            # same members as before the restart, the restored state is still ours
+            self.shard_ring = sharding.HashRing(members)
+        elif self.shard_ring is None or self.shard_ring.members != members:
+            LOG.info(_LI("Shard members of %(host)s are now %(members)s, resyncing"),
+                     {'host': self.agent_host, 'members': sorted(members)})
+            self.shard_ring = sharding.HashRing(members)
+            # networks may have moved to us, pick them up right away
+            self.last_full_sync = 0
+            self.scheduler.wake()
+
+    def _owns_network(self, network_id):
+        return self.shard_ring is None or self.shard_ring.owner(network_id) == self.shard_member
+
+    def _restore_snapshot(self):
+        """Warm start from the state saved by the previous run of this agent.
+
+        The first iteration still runs a full sync, so the bound ports are
+        queried from the server and anything changed while the agent was
+        down is reconciled. The VLAN cache entries keep their timestamps,
+        so only the device reads of VLANs verified within vlan_cache_ttl
+        are skipped.
+        """
+        state = snapshot.load(self.snapshot_file)
+        if state is None:
+            return
+
+        age = time.time() - state['saved_at']
+        if state['agent_host'] != self.agent_host or state['shard_member'] != self.shard_member:
+            LOG.warning(_LW("Ignoring agent snapshot %(path)s of %(member)s"),
+                        {'path': self.snapshot_file, 'member': state['shard_member']})
+            return
+        if not 0 <= age <= self.conf.AGENT.snapshot_max_age:
+            LOG.info(_LI("Ignoring agent snapshot %(path)s, it is %(age)d seconds old"),
+                     {'path': self.snapshot_file, 'age': age})
+            return
+
+        for network_id, port_ids in state['network_ports'].items():
+            self.network_ports[network_id] = set(port_ids)
+        for hostname, folder, name, segmentation_id, checked in state['vlan_cache']:
+            self.vlan_cache[(hostname, folder, name)] = (segmentation_id, checked)
+        self.sync_generation = state['generation']
+        self.managed_vlans = state['managed_vlans']
+        self.gc_bound_vlans = state.get('gc_bound_vlans')
+        if state['shard_members'] is not None:
+            self.restored_shard_members = set(state['shard_members'])
+
+        LOG.info(_LI("Restored %(networks)d networks and %(vlans)d verified VLANs of sync "
+                     "generation %(generation)d from %(path)s"),
+                 {'networks': len(self.network_ports), 'vlans': len(self.vlan_cache),
+                  'generation': self.sync_generation, 'path': self.snapshot_file})
+
+    def _save_snapshot(self):
+        if not self.sync_generation:
+            # nothing reconciled yet, a previous snapshot is still better than this state
+            return
+
+        state = {'agent_host': self.agent_host,
+                 'shard_member': self.shard_member,
+                 'shard_members': sorted(self.shard_ring.members) if self.shard_ring else None,
+                 'saved_at': time.time(),
+                 'generation': self.sync_generation,
+                 'managed_vlans': self.managed_vlans,
+                 'gc_bound_vlans': self.gc_bound_vlans,
+                 'network_ports': dict((network_id, sorted(port_ids))
+                                       for network_id, port_ids in self.network_ports.items() if port_ids),
+                 'vlan_cache': [list(key) + list(entry) for key, entry in self.vlan_cache.items()]}
+        try:
+            with self.metrics.timer('f5_agent_snapshot_seconds'):
+                snapshot.save(self.snapshot_file, state)
+            self.last_snapshot = state['saved_at']
+        except Exception:
+            LOG.exception(_LE("Failed saving the agent snapshot to %s"), self.snapshot_file)
+
     def _check_and_handle_signal(self):
         if self.catch_sigterm:
             LOG.info(_LI("Agent caught SIGTERM, quitting daemon loop."))
@@ -182,6 +442,12 @@ class F5NeutronAgent():
             config.setup_logging()
             self.conf.log_opt_values(LOG, logging.DEBUG)
             self.catch_sighup = False
+        if self.catch_sigusr1:
+            self.catch_sigusr1 = False
+            if self.profiler is None:
+                self._start_profiler()
+            else:
+                self._stop_profiler()
         return self.run_daemon_loop
 
     def _handle_sigterm(self, signum, frame):
@@ -192,46 +458,451 @@ class F5NeutronAgent():
     def _handle_sighup(self, signum, frame):
         self.catch_sighup = True
 
-    def _scan_ports(self):
-        start = time.clock()
+    def _handle_sigusr1(self, signum, frame):
+        self.catch_sigusr1 = True
 
-        # For now get all ports, we will then check for the corresponding VLAN config on the device
-        # Will not scale but should prove concept works, we are also using direct DB calls rather than RPC, I suspect this
-        # is an anti pattern and done properly we should extend the RPC API to allow us to scan the LB ports
-
-
-        all_ports = self.db.get_ports(self.context_with_session, filters={})
-
-        for port in all_ports:
-            LOG.info( port)
-            LOG.info(_LI("Agent port scan for port {}".format(port['id'])))
-
-            network = self.db.get_network(self.context_with_session, port['network_id'])
-            binding_levels = db_ml2.get_binding_levels(self.context_with_session.session, port['id'], self.agent_host)
-            for binding_level in binding_levels:
-                LOG.info(_LI("Binding level {}".format(binding_level)))
+    def _handle_sigusr2(self, signum, frame):
+        # dump right away, the loop may be the one that is stuck
+        try:
+            fd, path = profiling.create_output(self.profile_dir, 'stacks')
+            with os.fdopen(fd, 'w') as f:
+                f.write(profiling.format_stacks())
+            LOG.info(_LI("Agent caught SIGUSR2, dumped the greenthread stacks to %s"), path)
+        except Exception:
+            LOG.exception(_LE("Failed dumping the greenthread stacks to %s"), self.profile_dir)
 
-                # if segment bound with ml2f5 driver
-                if binding_level.driver == 'f5ml2':
-                    segment = db_ml2.get_segment_by_id(self.context_with_session.session, binding_level.segment_id)
-                    if segment['network_type'] == 'vlan':
-                        # and type is VLAN
-                        # Get VLANs from iControl for port network and check they are bound to the correct VLAN
-                        for bigip in self.f5_driver.get_config_bigips():
-                            folder = 'Project_' + network['tenant_id']
-                            name = 'vlan-' + network['id'][0:10]
+    def _start_profiler(self):
+        try:
+            fd, path = profiling.create_output(self.profile_dir, 'prof')
+        except Exception:
+            LOG.exception(_LE("Failed creating a profile file in %s"), self.profile_dir)
+            return
+        LOG.info(_LI("Agent caught SIGUSR1, profiling the next %(iterations)d iterations into %(path)s"),
+                 {'iterations': self.conf.AGENT.profile_iterations, 'path': path})
+        self.profiler = profiling.IterationProfiler(self.conf.AGENT.profile_iterations, fd, path)
+
+    def _stop_profiler(self):
+        profiler, self.profiler = self.profiler, None
+        try:
+            top = profiler.stop()
+            LOG.info(_LI("Wrote the profile of %(iterations)d iterations to %(path)s:\n%(top)s"),
+                     {'iterations': profiler.done, 'path': profiler.path, 'top': top})
+        except Exception:
+            LOG.exception(_LE("Failed writing the profile to %s"), profiler.path)
+
+    def _get_device_throttle(self, hostname):
+        if hostname not in self.device_throttles:
+            self.device_throttles[hostname] = (
+                throttle.CircuitBreaker(self.conf.AGENT.device_failure_threshold,
+                                        self.conf.AGENT.device_breaker_backoff,
+                                        self.conf.AGENT.device_breaker_max_backoff),
+                throttle.TokenBucket(self.conf.AGENT.device_rate_limit,
+                                     self.conf.AGENT.device_rate_burst))
+        return self.device_throttles[hostname]
+
+    def _device_request(self, bigip, func, *args, **kwargs):
+        """Run a single iControl REST call bounded by the request timeout.
+
+        Calls are rate limited per device and fail fast with DeviceUnavailable
+        while the device's circuit breaker is open.
+        """
+        return self._device_requests(bigip, 1, func, *args, **kwargs)
+
+    def _device_requests(self, bigip, count, func, *args, **kwargs):
+        """Like _device_request, for a func making count iControl REST calls.
+
+        All of them are taken from the rate limit up front, so a transaction
+        counts with every call it makes.
+        """
+        hostname = bigip.hostname
+        breaker, limiter = self._get_device_throttle(hostname)
+        if not breaker.allow():
+            self.metrics.inc('f5_agent_device_calls_rejected_total', bigip=hostname)
+            raise throttle.DeviceUnavailable(hostname, breaker.retry_at)
+        if limiter.acquire(count):
+            self.metrics.inc('f5_agent_device_calls_throttled_total', bigip=hostname)
 
-                            v = bigip.net.vlans.vlan
-                            if v.exists(name=name, partition=folder):
-                                v.load(name=name, partition=folder)
-                                tag = v.tag
-                                if tag != segment['segmentation_id']:
-                                    # Update VLAN tag in case of mismatch
-                                    LOG.info("Updating VLAN tag was %s needs to be %s", tag, segment['segmentation_id'])
-                                    v.tag = segment['segmentation_id']
-                                    v.update()
+        try:
+            with self.metrics.timer('f5_agent_device_request_seconds',
+                                    bigip=hostname, call=func.__name__):
+                with eventlet.Timeout(self.conf.AGENT.device_request_timeout):
+                    result = func(*args, **kwargs)
+        except eventlet.Timeout as e:
+            self.metrics.inc('f5_agent_device_timeouts_total', bigip=hostname)
+            self._device_request_failed(hostname, breaker, e)
+            raise
+        except Exception as e:
+            self.metrics.inc('f5_agent_device_errors_total', bigip=hostname)
+            self._device_request_failed(hostname, breaker, e)
+            raise
+
+        breaker.success()
+        return result
+
+    def _device_request_failed(self, hostname, breaker, exc):
+        if not throttle.is_device_failure(exc):
+            # the device answered, it is healthy even if the call was wrong
+            breaker.success()
+        elif breaker.failure():
+            LOG.warning(_LW("Circuit breaker of %(bigip)s opened after %(failures)d failures, "
+                            "next probe in %(backoff).0f seconds"),
+                        {'bigip': hostname, 'failures': breaker.failures,
+                         'backoff': breaker.retry_at - time.time()})
+            self.metrics.inc('f5_agent_device_breaker_opened_total', bigip=hostname)
+
+    def _get_vlan_inventory(self, bigip, partitions, pool):
+        """Fetch the VLANs of a BIG-IP in bulk, indexed by (partition, name)."""
+        vlans = bigip.net.vlans
+        if self.conf.AGENT.vlan_inventory_per_partition:
+            requests = [{'requests_params': {'params': '$filter=partition+eq+' + partition}}
+                        for partition in partitions]
+        else:
+            requests = [{}]
+
+        inventory = {}
+        for collection in pool.imap(lambda kwargs: self._device_request(bigip, vlans.get_collection, **kwargs),
+                                    requests):
+            for v in collection:
+                inventory[(v.partition, v.name)] = v
+        return inventory
+
+    def _is_vlan_cached(self, bigip, folder, name, segmentation_id, now):
+        entry = self.vlan_cache.get((bigip.hostname, folder, name))
+        return (entry is not None and entry[0] == segmentation_id and
+                now - entry[1] < self.conf.AGENT.vlan_cache_ttl)
+
+    def _cache_vlan(self, bigip, folder, name, segmentation_id):
+        if self.conf.AGENT.vlan_cache_ttl > 0:
+            self.vlan_cache[(bigip.hostname, folder, name)] = (segmentation_id, time.time())
+
+    def _evict_vlan_cache(self, network_id):
+        name = naming.vlan_name(network_id)
+        for key in [key for key in self.vlan_cache if key[2] == name]:
+            del self.vlan_cache[key]
+
+    def _vlan_tag_corrected(self, bigip, v, segmentation_id):
+        self._cache_vlan(bigip, v.partition, v.name, segmentation_id)
+        self.scan_stats['tags_corrected'] += 1
+        self.metrics.inc('f5_agent_vlan_tags_corrected_total', bigip=bigip.hostname)
+
+    def _update_vlan_tag(self, bigip, v, segmentation_id):
+        LOG.info("Updating VLAN %s on %s, tag was %s needs to be %s",
+                 v.name, bigip.hostname, v.tag, segmentation_id)
+        try:
+            v.tag = segmentation_id
+            self._device_request(bigip, v.update)
+            self._vlan_tag_corrected(bigip, v, segmentation_id)
+        except throttle.DeviceUnavailable as e:
+            LOG.warning(_LW("Not updating VLAN %(name)s: %(error)s"), {'name': v.name, 'error': e})
+        except (Exception, eventlet.Timeout):
+            LOG.exception(_LE("Failed updating VLAN %(name)s on %(bigip)s"),
+                          {'name': v.name, 'bigip': bigip.hostname})
+
+    @staticmethod
+    def _get_transaction(bigip):
+        transactions = bigip.tm.transactions if hasattr(bigip, 'tm') else bigip.transactions
+        return transactions.transaction
+
+    def _commit_vlan_transaction(self, bigip, batch):
+        """Update the tags of a batch of VLANs within one iControl REST transaction."""
+        tags = [v.tag for v, segmentation_id in batch]
+        try:
+            with f5_contexts.TransactionContextManager(self._get_transaction(bigip)):
+                for v, segmentation_id in batch:
+                    v.tag = segmentation_id
+                    v.update()
+        except (Exception, eventlet.Timeout):
+            # the transaction was rolled back, so are our local copies
+            for (v, segmentation_id), tag in zip(batch, tags):
+                v.tag = tag
+            raise
+        finally:
+            # the transaction id is a header of the shared session, every later
+            # request would join the transaction if it was left behind on errors
+            session = sessions.requests_session(bigip)
+            if session is not None:
+                session.headers.pop('X-F5-REST-Coordination-Id', None)
+
+    def _update_vlan_tags(self, bigip, batch):
+        for v, segmentation_id in batch:
+            LOG.info("Updating VLAN %s on %s, tag was %s needs to be %s",
+                     v.name, bigip.hostname, v.tag, segmentation_id)
+        try:
+            # begin, one update per VLAN and commit
+            self._device_requests(bigip, len(batch) + 2, self._commit_vlan_transaction, bigip, batch)
+        except (Exception, eventlet.Timeout):
+            LOG.warning(_LW("Transaction of %(count)d VLAN updates on %(bigip)s failed, "
+                            "falling back to single updates"),
+                        {'count': len(batch), 'bigip': bigip.hostname}, exc_info=True)
+            for v, segmentation_id in batch:
+                self._update_vlan_tag(bigip, v, segmentation_id)
+            return
+
+        for v, segmentation_id in batch:
+            self._vlan_tag_corrected(bigip, v, segmentation_id)
+
+    def _reconcile_device(self, bigip, desired):
+        # Only go to the device if a desired tag is not known to be applied there already
+        now = time.time()
+        stale = [(folder, name, segmentation_id) for folder, name, segmentation_id in desired
+                 if not self._is_vlan_cached(bigip, folder, name, segmentation_id, now)]
+        if not stale:
+            return
 
-        LOG.info(_LI("Scan ports completed in {} seconds".format(time.clock() - start)))
+        try:
+            with self.metrics.timer('f5_agent_device_reconcile_seconds', bigip=bigip.hostname):
+                self._reconcile_stale_vlans(bigip, stale)
+        except throttle.DeviceUnavailable as e:
+            LOG.warning(_LW("Skipping the reconciliation of %(bigip)s: %(error)s"),
+                        {'bigip': bigip.hostname, 'error': e})
+        except (Exception, eventlet.Timeout):
+            LOG.exception(_LE("Error while reconciling VLANs on %s"), bigip.hostname)
+
+    def _reconcile_stale_vlans(self, bigip, stale):
+        pool = eventlet.GreenPool(self.conf.AGENT.device_request_concurrency)
+        partitions = set(folder for folder, name, segmentation_id in stale)
+        vlans = self._get_vlan_inventory(bigip, partitions, pool)
+
+        corrections = []
+        for folder, name, segmentation_id in stale:
+            self.scan_stats['vlan_checks'] += 1
+            self.metrics.inc('f5_agent_vlans_checked_total', bigip=bigip.hostname)
+            v = vlans.get((folder, name))
+            if v is None:
+                continue
+            if v.tag != segmentation_id:
+                corrections.append((v, segmentation_id))
+            else:
+                self._cache_vlan(bigip, folder, name, segmentation_id)
+
+        # Commit the corrections of the cycle in transactions, one round-trip per batch.
+        # A transaction is bound to the session of the device, so nothing else may
+        # call the device while one is open: the batches go one after the other.
+        batch_size = self.conf.AGENT.vlan_update_batch_size
+        if f5_contexts is not None and batch_size > 1 and len(corrections) > 1:
+            for i in range(0, len(corrections), batch_size):
+                self._update_vlan_tags(bigip, corrections[i:i + batch_size])
+        else:
+            for v, segmentation_id in corrections:
+                pool.spawn_n(self._update_vlan_tag, bigip, v, segmentation_id)
+
+        pool.waitall()
+
+    def _is_gc_leader(self):
+        # one agent per host collects the orphans, all others would race it
+        return self.shard_ring is None or min(self.shard_ring.members) == self.shard_member
+
+    def _collect_orphan_vlans(self):
+        """Delete VLANs orphaned for longer than the grace period, in rate limited batches."""
+        bound, previous = len(self.bound_vlans), self.gc_bound_vlans
+        self.gc_bound_vlans = bound
+        if not bound or (previous and bound < previous * (1 - self.conf.AGENT.orphan_vlan_max_drop)):
+            # more likely a truncated port query than that many networks gone at once
+            LOG.warning(_LW("Skipping the VLAN garbage collection, %(bound)d VLANs are bound on "
+                            "%(host)s, %(previous)s were at the previous full sync"),
+                        {'bound': bound, 'host': self.agent_host, 'previous': previous})
+            self.metrics.inc('f5_agent_vlan_gc_skipped_total')
+            return
+
+        with self.metrics.timer('f5_agent_phase_seconds', phase='vlan_gc'):
+            for bigip in self.device_sessions.checkout():
+                self.device_pool.spawn_n(self._collect_device_orphan_vlans, bigip)
+            self.device_pool.waitall()
+
+    def _collect_device_orphan_vlans(self, bigip):
+        now = time.time()
+        try:
+            collection = self._device_request(bigip, bigip.net.vlans.get_collection)
+        except throttle.DeviceUnavailable as e:
+            LOG.warning(_LW("Skipping the VLAN garbage collection of %(bigip)s: %(error)s"),
+                        {'bigip': bigip.hostname, 'error': e})
+            return
+        except (Exception, eventlet.Timeout):
+            LOG.exception(_LE("Failed listing the VLANs of %s for garbage collection"), bigip.hostname)
+            return
+
+        orphans = {}
+        for v in collection:
+            if (naming.is_agent_vlan(v.partition, v.name) and
+                    (v.partition, v.name) not in self.bound_vlans):
+                orphans[(bigip.hostname, v.partition, v.name)] = v
+
+        # forget candidates which were deleted meanwhile or got bound again
+        for key in [key for key in self.orphan_vlans if key[0] == bigip.hostname and key not in orphans]:
+            del self.orphan_vlans[key]
+
+        expired = []
+        for key, v in sorted(orphans.items()):
+            first_seen = self.orphan_vlans.setdefault(key, now)
+            if now - first_seen >= self.conf.AGENT.orphan_vlan_grace_period:
+                expired.append((key, v))
+        if not expired:
+            return
+
+        LOG.info(_LI("%(expired)d of %(orphans)d orphaned VLANs on %(bigip)s are past their grace "
+                     "period, deleting up to %(batch)d"),
+                 {'expired': len(expired), 'orphans': len(orphans), 'bigip': bigip.hostname,
+                  'batch': self.conf.AGENT.orphan_vlan_batch_size})
+        rate = self.conf.AGENT.orphan_vlan_delete_rate
+        delay = 1.0 / rate if rate > 0 else 0
+        for key, v in expired[:self.conf.AGENT.orphan_vlan_batch_size]:
+            try:
+                self._device_request(bigip, v.delete)
+            except throttle.DeviceUnavailable as e:
+                LOG.warning(_LW("Stopping the VLAN garbage collection of %(bigip)s: %(error)s"),
+                            {'bigip': bigip.hostname, 'error': e})
+                return
+            except (Exception, eventlet.Timeout):
+                # usually still referenced by a self IP or route domain, try again next time
+                LOG.warning(_LW("Failed deleting orphaned VLAN %(name)s in %(partition)s on %(bigip)s"),
+                            {'name': v.name, 'partition': v.partition, 'bigip': bigip.hostname},
+                            exc_info=True)
+                self.metrics.inc('f5_agent_vlan_delete_errors_total', bigip=bigip.hostname)
+            else:
+                LOG.info(_LI("Deleted orphaned VLAN %(name)s in %(partition)s on %(bigip)s"),
+                         {'name': v.name, 'partition': v.partition, 'bigip': bigip.hostname})
+                self.metrics.inc('f5_agent_vlans_deleted_total', bigip=bigip.hostname)
+                del self.orphan_vlans[key]
+                self.vlan_cache.pop(key, None)
+            eventlet.sleep(delay)
+
+    def _scan_ports(self, port_ids=None, resolved_ports=()):
+        """Reconcile the VLANs of F5 bound ports.
+
+        Either all of them, or only port_ids and the already resolved F5Port
+        records in resolved_ports.
+        """
+        start = time.time()
+
+        # Only ports bound by the f5ml2 driver on this host are streamed from the server, already joined
+        # with their network and segment, so the agent does not need any DB access
+        f5_ports = []
+        if port_ids is None or port_ids:
+            f5_ports = self._cache_networks(self.f5_plugin_rpc.iter_f5_ports(
+                self.context, self.agent_host, port_ids=port_ids, page_size=self.conf.AGENT.rpc_page_size))
+        f5_ports = itertools.chain(f5_ports, resolved_ports)
+
+        if port_ids is None:
+            network_ports = collections.defaultdict(set)
+        else:
+            network_ports = self.network_ports
+
+        # Group the ports by (tenant, network, segment) first, the VLAN name and tag only depend on those.
+        # Ports are streamed as compact records and only their ids are kept.
+        segments = set()
+        seen_ports = set()
+        bound_networks = set()
+        port_count = 0
+        with self.metrics.timer('f5_agent_phase_seconds', phase='port_query'):
+            for port in f5_ports:
+                LOG.debug("Agent port scan for port %s", port.id)
+                if port_ids is None and port.network_type == p_constants.TYPE_VLAN:
+                    # orphan detection needs the networks of all shards
+                    bound_networks.add((port.tenant_id, port.network_id))
+                if not self._owns_network(port.network_id):
+                    continue
+                port_count += 1
+                if port_ids is not None:
+                    seen_ports.add(port.id)
+                network_ports[port.network_id].add(port.id)
+
+                if port.network_type == p_constants.TYPE_VLAN:
+                    segments.add((port.tenant_id, port.network_id, port.segmentation_id))
+        self.metrics.inc('f5_agent_ports_scanned_total', port_count)
+
+        if port_ids is None:
+            self.network_ports = network_ports
+            self.bound_vlans = set((naming.vlan_folder(tenant_id), naming.vlan_name(network_id))
+                                   for tenant_id, network_id in bound_networks)
+        else:
+            # ports no longer bound here must not be fanned out on network updates anymore
+            for port_id in set(port_ids) - seen_ports:
+                self._clean_network_ports(port_id)
+
+        # Build the desired state, then diff it against one VLAN listing per device
+        desired = []
+        for tenant_id, network_id, segmentation_id in segments:
+            desired.append((naming.vlan_folder(tenant_id), naming.vlan_name(network_id), segmentation_id))
+
+        if port_ids is None:
+            # drop cache entries of VLANs that are not wanted anymore
+            wanted = set((folder, name) for folder, name, segmentation_id in desired)
+            for key in [key for key in self.vlan_cache if key[1:] not in wanted]:
+                del self.vlan_cache[key]
+            self.managed_vlans = len(desired)
+
+        self.scan_stats = {'ports': port_count,
+                           'vlans': len(desired),
+                           'vlan_checks': 0,
+                           'tags_corrected': 0}
+
+        if desired:
+            # Devices are reconciled concurrently, so a slow BIG-IP only delays itself
+            with self.metrics.timer('f5_agent_phase_seconds', phase='device_reconcile'):
+                for bigip in self.device_sessions.checkout():
+                    self.device_pool.spawn_n(self._reconcile_device, bigip, desired)
+                self.device_pool.waitall()
+        elif port_ids is None:
+            # keep the reported device health current while owning no network
+            self.device_sessions.checkout()
+
+        LOG.info(_LI("Scan ports completed in {} seconds".format(time.time() - start)))
+        return self.scan_stats
+
+    def _process_ports(self, start):
+        # Swap out the dirty sets, RPC handlers keep filling fresh ones meanwhile
+        updated_ports, self.updated_ports = self.updated_ports, set()
+        deleted_ports, self.deleted_ports = self.deleted_ports, set()
+        resolved_ports, self.resolved_ports = self.resolved_ports, {}
+
+        for port_id in deleted_ports:
+            self._clean_network_ports(port_id)
+
+        full_sync = start - self.last_full_sync >= self.conf.AGENT.full_sync_interval
+        port_stats = {'full_sync': full_sync,
+                      'updated': len(updated_ports),
+                      'resolved': len(resolved_ports),
+                      'deleted': len(deleted_ports)}
+        try:
+            if full_sync:
+                port_stats.update(self._scan_ports())
+                self.last_full_sync = start
+                self.sync_generation += 1
+                if self.conf.AGENT.orphan_vlan_gc and self._is_gc_leader():
+                    self._collect_orphan_vlans()
+            elif updated_ports or resolved_ports:
+                port_stats.update(self._scan_ports(port_ids=updated_ports,
+                                                   resolved_ports=list(resolved_ports.values())))
+        except Exception:
+            # retry the ports next iteration, unless they got deleted meanwhile
+            self.updated_ports |= (updated_ports | set(resolved_ports)) - self.deleted_ports
+            raise
+
+        return port_stats
+
+    def _update_overrun(self, elapsed, full_sync):
+        """Track whether the incremental cycles keep taking longer than the polling interval.
+
+        Full syncs are expected to take longer and do not count. Once
+        overrunning, the agent only reports back in after its cycles took
+        less than half the interval for a full sync interval, so it does
+        not flap in and out of the shard ring.
+        """
+        if not full_sync:
+            self.cycle_average += 0.2 * (elapsed - self.cycle_average)
+
+        now = time.time()
+        if self.cycle_average > self.polling_interval:
+            if not self.overrunning:
+                LOG.warning(_LW("Cycles take %(average).1f seconds on average, more than the polling "
+                                "interval of %(interval)s seconds, reporting overrun"),
+                            {'average': self.cycle_average, 'interval': self.polling_interval})
+            self.overrunning = True
+            self.last_overrun = now
+        elif (self.overrunning and self.cycle_average < self.polling_interval / 2.0 and
+              now - self.last_overrun >= self.conf.AGENT.full_sync_interval):
+            LOG.info(_LI("Cycles keep up with the polling interval again"))
+            self.overrunning = False
 
     def loop_count_and_wait(self, start_time, port_stats):
         # sleep till end of polling interval
@@ -243,13 +914,36 @@ class F5NeutronAgent():
                    'port_stats': port_stats,
                    'elapsed': elapsed})
 
-        if elapsed < self.polling_interval:
-            time.sleep(self.polling_interval - elapsed)
-        else:
+        self.metrics.observe('f5_agent_cycle_seconds', elapsed)
+        # a fixed size summary, agent configurations are stored in a 4k column
+        self.agent_state['configurations']['metrics'] = {
+            'cycle': self.metrics.totals('f5_agent_cycle_seconds', None).get(None),
+            'phases': self.metrics.totals('f5_agent_phase_seconds', 'phase')}
+        self._update_overrun(elapsed, port_stats.get('full_sync'))
+        # lets the server move networks away from unhealthy and overrunning agents
+        self.agent_state['configurations']['load'] = {
+            'vlans': self.managed_vlans,
+            'cycle_seconds': round(self.cycle_average, 3),
+            'overrunning': self.overrunning,
+            'devices_total': self.device_sessions.devices_total,
+            'devices_healthy': self.device_sessions.devices_healthy}
+        self.metrics.flush()
+
+        if elapsed > self.scheduler.current_interval:
             LOG.debug("Loop iteration exceeded interval "
                       "(%(polling_interval)s vs. %(elapsed)s)!",
-                      {'polling_interval': self.polling_interval,
+                      {'polling_interval': self.scheduler.current_interval,
                        'elapsed': elapsed})
+
+        snapshot_interval = self.conf.AGENT.snapshot_interval
+        if snapshot_interval > 0 and time.time() - self.last_snapshot >= snapshot_interval:
+            self._save_snapshot()
+
+        if self.profiler is not None and self.profiler.iteration_done():
+            self._stop_profiler()
+
+        # sleeps until the jittered, possibly backed off, interval is over or dirty ports arrive
+        self.scheduler.wait(self.scheduler.next_delay(elapsed))
         self.iter_num = self.iter_num + 1
 
     def rpc_loop(self, ):
@@ -259,7 +953,7 @@ class F5NeutronAgent():
             port_stats = {}
             try:
 
-                self._scan_ports()
+                port_stats = self._process_ports(start)
 
             except Exception:
                 LOG.exception(_LE("Error while processing ports"))
@@ -272,4 +966,11 @@ class F5NeutronAgent():
         signal.signal(signal.SIGTERM, self._handle_sigterm)
         if hasattr(signal, 'SIGHUP'):
             signal.signal(signal.SIGHUP, self._handle_sighup)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self._handle_sigusr1)
+            signal.signal(signal.SIGUSR2, self._handle_sigusr2)
         self.rpc_loop()
+
+        # the next start only has to verify what changed since now
+        if self.conf.AGENT.snapshot_interval > 0:
+            self._save_snapshot()
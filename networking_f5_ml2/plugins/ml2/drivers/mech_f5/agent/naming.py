@@ -0,0 +1,35 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Names of the objects the F5 agent manages on the BIG-IPs."""
+
+PARTITION_PREFIX = 'Project_'
+VLAN_PREFIX = 'vlan-'
+
+
+def vlan_folder(tenant_id):
+    """Partition holding the VLANs of a tenant on the BIG-IPs."""
+    return PARTITION_PREFIX + tenant_id
+
+
+def vlan_name(network_id):
+    """Name of the VLAN of a network on the BIG-IPs."""
+    return VLAN_PREFIX + network_id[0:10]
+
+
+def is_agent_vlan(partition, name):
+    """Whether a VLAN on a BIG-IP follows the naming of the agent."""
+    return partition.startswith(PARTITION_PREFIX) and name.startswith(VLAN_PREFIX)
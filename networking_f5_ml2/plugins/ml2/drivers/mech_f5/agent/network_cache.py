@@ -0,0 +1,60 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+
+# What the agent needs to know about a network to reconcile its VLAN
+NetworkInfo = collections.namedtuple('NetworkInfo', ['tenant_id', 'network_type', 'segmentation_id'])
+
+
+class NetworkCache(object):
+    """Bounded LRU cache of network metadata with a TTL.
+
+    Entries are meant to be invalidated by network notifications, the TTL
+    only bounds how long a missed notification goes unnoticed.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, network_id):
+        entry = self._entries.pop(network_id, None)
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries[network_id] = entry
+        return entry[0]
+
+    def put(self, network_id, info):
+        if self.size <= 0:
+            return
+        self._entries.pop(network_id, None)
+        if len(self._entries) >= self.size:
+            self._entries.popitem(last=False)
+        self._entries[network_id] = (info, time.time())
+
+    def invalidate(self, network_id):
+        self._entries.pop(network_id, None)
@@ -0,0 +1,93 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Diagnostics of a running agent, triggered by signals."""
+
+import cProfile
+import gc
+import marshal
+import os
+import pstats
+import sys
+import tempfile
+import time
+import traceback
+
+import greenlet
+import six
+
+
+def default_dir(state_path):
+    """Directory below the neutron state_path the diagnostics go to by default."""
+    return os.path.join(state_path, 'f5-ml2-agent-diagnostics')
+
+
+def create_output(directory, suffix):
+    """Create a new file for diagnostics output, return its (fd, path).
+
+    The file gets a name of its own and is opened exclusively, so an
+    existing file or symlink is never written through.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    return tempfile.mkstemp(suffix='.' + suffix, dir=directory,
+                            prefix='f5-ml2-agent-%d-%s-' % (os.getpid(), time.strftime('%Y%m%d%H%M%S')))
+
+
+def format_stacks():
+    """Return the stacks of all greenthreads and native threads."""
+    lines = []
+    for obj in gc.get_objects():
+        if not isinstance(obj, greenlet.greenlet) or not obj:
+            continue
+        lines.append('Greenthread %s:\n' % hex(id(obj)))
+        lines.extend(traceback.format_stack(obj.gr_frame))
+        lines.append('\n')
+
+    for thread_id, frame in sys._current_frames().items():
+        lines.append('Thread %s:\n' % thread_id)
+        lines.extend(traceback.format_stack(frame))
+        lines.append('\n')
+    return ''.join(lines)
+
+
+class IterationProfiler(object):
+    """cProfile over a given number of loop iterations, written to the file opened as fd."""
+
+    def __init__(self, iterations, fd, path):
+        self.iterations = iterations
+        self.fd = fd
+        self.path = path
+        self.done = 0
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def iteration_done(self):
+        """Count an iteration, return True once all of them were profiled."""
+        self.done += 1
+        return self.done >= self.iterations
+
+    def stop(self, top=25):
+        """Write the stats to path and return the top functions by cumulative time."""
+        self._profile.disable()
+        # what Profile.dump_stats() writes, without opening path again
+        self._profile.create_stats()
+        with os.fdopen(self.fd, 'wb') as f:
+            marshal.dump(self._profile.stats, f)
+
+        stream = six.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats('cumulative').print_stats(top)
+        return stream.getvalue()
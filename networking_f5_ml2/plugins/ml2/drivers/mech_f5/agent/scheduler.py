@@ -0,0 +1,85 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import random
+import time
+
+import eventlet
+from eventlet import event
+
+
+def jittered(interval, jitter):
+    """Spread interval randomly by +/- the jitter fraction."""
+    return interval * (1 + random.uniform(-jitter, jitter))
+
+
+class AdaptiveScheduler(object):
+    """Paces the agent daemon loop.
+
+    Iterations are spaced by the polling interval with random jitter, so a
+    fleet of agents does not hit the server and the devices in lockstep. If
+    an iteration overruns, the interval doubles up to max_interval and then
+    shrinks back once iterations take less than half of it. wake() ends the
+    current wait early, e.g. when RPC notifications queued dirty work, but
+    iterations stay at least min_interval apart, stretched by the current
+    backoff, so a burst of notifications cannot bypass the backoff.
+    """
+
+    def __init__(self, interval, max_interval, jitter=0.0, min_interval=0.0):
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self.current_interval = interval
+        self._wakeup = event.Event()
+
+    def wake(self):
+        if not self._wakeup.ready():
+            self._wakeup.send()
+
+    def next_delay(self, elapsed):
+        """Adapt the interval to the last iteration and return the delay until the next one."""
+        if elapsed > self.current_interval:
+            self.current_interval = min(self.current_interval * 2, self.max_interval)
+        elif elapsed < self.current_interval / 2.0:
+            # only with real margin, otherwise the interval would flap around the cycle time
+            self.current_interval = max(self.current_interval / 2.0, self.interval)
+
+        return max(jittered(self.current_interval, self.jitter) - elapsed, 0)
+
+    def wait(self, delay):
+        """Sleep for delay seconds unless woken up earlier.
+
+        Returns True if the wait ended because of wake().
+        """
+        start = time.time()
+        woken = False
+        with eventlet.Timeout(delay, False):
+            self._wakeup.wait()
+            woken = True
+
+        self._wakeup = event.Event()
+        if woken:
+            remaining = min(self.min_spacing(), delay) - (time.time() - start)
+            if remaining > 0:
+                eventlet.sleep(remaining)
+        return woken
+
+    def min_spacing(self):
+        """Seconds a wake-up still has to wait, grows with the backoff."""
+        if not self.interval:
+            return self.min_interval
+        return self.min_interval * self.current_interval / float(self.interval)
@@ -0,0 +1,157 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+from neutron.i18n import _LW
+from oslo_log import log as logging
+from requests import adapters
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import throttle
+
+LOG = logging.getLogger(__name__)
+
+
+def requests_session(bigip):
+    """The requests session behind an f5-sdk BIG-IP handle, if it has one."""
+    try:
+        return bigip._meta_data['icr_session'].session
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+class DeviceSession(object):
+    """A BIG-IP handle kept across scan cycles with its keep-alive state."""
+
+    def __init__(self, bigip, pool_size):
+        self.bigip = bigip
+        self.last_checked = 0
+        self.token = None
+        self.connections = 0
+
+        self.session = requests_session(bigip)
+        if self.session is not None:
+            # keep the adapter f5-sdk configured, only make its keep-alive
+            # pool big enough for all concurrent requests
+            adapter = self.session.get_adapter('https://')
+            if isinstance(adapter, adapters.HTTPAdapter) and adapter._pool_maxsize < pool_size:
+                adapter.init_poolmanager(adapter._pool_connections, pool_size,
+                                         block=adapter._pool_block)
+
+    @property
+    def auth(self):
+        return getattr(self.session, 'auth', None)
+
+    def count_connections(self):
+        """Return the number of connections opened so far, each one a TLS handshake."""
+        count = 0
+        adapter = self.session.get_adapter('https://')
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            count += getattr(pools[key], 'num_connections', 0)
+        return count
+
+
+def health_check(device):
+    """Fail unless the device answers an authenticated iControl REST call."""
+    device.session.get(device.bigip._meta_data['uri'] + 'sys/clock').raise_for_status()
+
+
+class DeviceSessionPool(object):
+    """Hands out the BIG-IP handles of the LBaaS driver, reusing them across cycles.
+
+    Handles are health checked concurrently on checkout when they were idle
+    for a while, auth tokens about to expire are dropped so the next request
+    logs in again before the device rejects it, and new connections and
+    logins are counted in the agent metrics.
+
+    Health checks go through request, the agent's guarded device call, whose
+    circuit breaker backs off from failing devices; while it is open the
+    device is skipped without a probe. A device failing its check keeps its
+    session and is checked again on the next checkout.
+    """
+
+    def __init__(self, f5_driver, metrics, request, concurrency, pool_size, health_check_interval,
+                 token_refresh_margin):
+        self.f5_driver = f5_driver
+        self.metrics = metrics
+        self.request = request
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.token_refresh_margin = token_refresh_margin
+        self.sessions = {}
+        # outcome of the last checkout, None until the first one
+        self.devices_total = None
+        self.devices_healthy = None
+
+    def checkout(self):
+        """Return the handles of all healthy devices for this cycle."""
+        devices = []
+        configured = self.f5_driver.get_config_bigips()
+        for bigip in configured:
+            device = self.sessions.get(bigip.hostname)
+            if device is None or device.bigip is not bigip:
+                # the driver handed out a new handle, its session starts over
+                device = self.sessions[bigip.hostname] = DeviceSession(bigip, self.pool_size)
+            devices.append(device)
+
+        bigips = []
+        if devices:
+            pool = eventlet.GreenPool(self.concurrency)
+            for device, healthy in zip(devices, pool.imap(self._check, devices)):
+                if healthy:
+                    bigips.append(device.bigip)
+
+        self.devices_total = len(configured)
+        self.devices_healthy = len(bigips)
+        return bigips
+
+    def _check(self, device):
+        now = time.time()
+        hostname = device.bigip.hostname
+        if device.session is None:
+            return True
+
+        auth = device.auth
+        expiration = getattr(auth, 'expiration', None)
+        if expiration and expiration - now < self.token_refresh_margin:
+            auth.token = None
+
+        if now - device.last_checked >= self.health_check_interval:
+            try:
+                self.request(device.bigip, health_check, device)
+            except throttle.DeviceUnavailable:
+                # the breaker paces the probes of the device
+                return False
+            except (Exception, eventlet.Timeout):
+                LOG.warning(_LW("Health check of %s failed"), hostname, exc_info=True)
+                self.metrics.inc('f5_agent_device_health_check_failures_total', bigip=hostname)
+                return False
+            device.last_checked = now
+
+        token = getattr(device.auth, 'token', None)
+        if token is not None and token != device.token:
+            self.metrics.inc('f5_agent_device_logins_total', bigip=hostname)
+            device.token = token
+
+        connections = device.count_connections()
+        if connections > device.connections:
+            self.metrics.inc('f5_agent_device_handshakes_total', connections - device.connections,
+                             bigip=hostname)
+        device.connections = connections
+        return True
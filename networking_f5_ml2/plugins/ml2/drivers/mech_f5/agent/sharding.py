@@ -0,0 +1,42 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import hashlib
+
+
+def _hash(value):
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:8], 16)
+
+
+class HashRing(object):
+    """Consistent hash ring assigning networks to the agents sharing a host.
+
+    Every member is placed on the ring several times, so when a member
+    joins or leaves only its share of the networks moves.
+    """
+
+    def __init__(self, members, replicas=64):
+        self.members = frozenset(members)
+        ring = sorted((_hash('%s-%d' % (member, i)), member)
+                      for member in self.members
+                      for i in range(replicas))
+        self._positions = [position for position, member in ring]
+        self._owners = [member for position, member in ring]
+
+    def owner(self, key):
+        index = bisect.bisect(self._positions, _hash(key)) % len(self._positions)
+        return self._owners[index]
@@ -0,0 +1,74 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""On-disk snapshot of the state the F5 agent has reconciled.
+
+The snapshot lets a restarted agent pick up where it left off instead of
+reading every VLAN from all BIG-IPs first. It is a single JSON document,
+replaced atomically so a crash while writing never leaves a torn file.
+"""
+
+import os
+import re
+import tempfile
+
+from neutron.i18n import _LW
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+
+LOG = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+def default_path(state_path, member):
+    """Snapshot file of an agent below the neutron state_path."""
+    return os.path.join(state_path, 'f5-ml2-agent-%s.json' % re.sub(r'[^\w.-]', '_', member))
+
+
+def save(path, state):
+    state = dict(state, version=VERSION)
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(jsonutils.dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def load(path):
+    """Return the snapshot stored at path, None if there is no usable one."""
+    try:
+        with open(path) as f:
+            state = jsonutils.loads(f.read())
+    except (IOError, OSError):
+        return None
+    except ValueError:
+        LOG.warning(_LW("Ignoring corrupt agent snapshot %s"), path)
+        return None
+
+    if not isinstance(state, dict) or state.get('version') != VERSION:
+        LOG.warning(_LW("Ignoring agent snapshot %s of an unknown version"), path)
+        return None
+    return state
@@ -0,0 +1,128 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+from requests import exceptions as requests_exceptions
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class DeviceUnavailable(Exception):
+    """Raised instead of calling a BIG-IP whose circuit breaker is open."""
+
+    def __init__(self, hostname, retry_at):
+        super(DeviceUnavailable, self).__init__(
+            'circuit breaker of %s is open, next probe in %.0f seconds' % (
+                hostname, max(0, retry_at - time.time())))
+        self.hostname = hostname
+        self.retry_at = retry_at
+
+
+def is_device_failure(exc):
+    """Whether exc means the device is unreachable or overloaded.
+
+    Errors the device answered with, like a 404 or a rejected update, say
+    nothing about its health and do not count against the breaker.
+    """
+    if isinstance(exc, (eventlet.Timeout, requests_exceptions.ConnectionError,
+                        requests_exceptions.Timeout)):
+        return True
+    response = getattr(exc, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status is not None and (status >= 500 or status == 429)
+
+
+class CircuitBreaker(object):
+    """Stops calling a device after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens and
+    rejects calls for backoff seconds. Then a single probe call is let
+    through: success closes the breaker, failure opens it again for twice
+    as long, up to max_backoff.
+    """
+
+    def __init__(self, failure_threshold, backoff, max_backoff):
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = 0
+        self._probing = False
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.time() >= self.retry_at:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._probing = False
+
+    def failure(self):
+        """Record a failed call, return True if this opened the breaker."""
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.opened += 1
+            self.state = OPEN
+            self.retry_at = time.time() + min(self.backoff * 2 ** (self.opened - 1), self.max_backoff)
+            return True
+        return False
+
+
+class TokenBucket(object):
+    """Caps the call rate to rate per second, allowing bursts of up to burst calls.
+
+    Taking more tokens than burst at once waits for a full bucket and
+    leaves a debt, which the following calls wait for.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+
+    def acquire(self, count=1):
+        """Take count tokens, sleeping until they are available. Returns the seconds waited."""
+        if self.rate <= 0:
+            return 0
+
+        needed = min(count, self.burst)
+        waited = 0
+        while True:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= needed:
+                self.tokens -= count
+                return waited
+            delay = (needed - self.tokens) / self.rate
+            eventlet.sleep(delay)
+            waited += delay
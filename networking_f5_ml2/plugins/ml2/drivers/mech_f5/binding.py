@@ -0,0 +1,123 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+
+from neutron.plugins.ml2 import driver_api as api
+
+
+def physnet_index(physical_networks):
+    """Freeze the configured physical networks, None means any."""
+    if physical_networks is None:
+        return None
+    return frozenset(physical_networks)
+
+
+def segments_key(segments):
+    """The parts of the segments to bind a binding decision depends on."""
+    return tuple((segment[api.NETWORK_TYPE], segment[api.PHYSICAL_NETWORK])
+                 for segment in segments)
+
+
+def agent_load(agent):
+    """Return (unhealthy, overrunning, vlans, cycle seconds) of the load an F5 agent reports.
+
+    Agents with none of their BIG-IPs healthy are unhealthy, agents whose
+    reconciliation cycles keep taking longer than their polling interval
+    report themselves overrunning. Agents not reporting a load are treated
+    as idle.
+    """
+    load = agent['configurations'].get('load') or {}
+    unhealthy = bool(load.get('devices_total')) and not load.get('devices_healthy')
+    return unhealthy, bool(load.get('overrunning')), load.get('vlans') or 0, load.get('cycle_seconds') or 0
+
+
+def fit_agents(agents):
+    """Return the agents neither unhealthy nor overrunning, all of them if none is."""
+    fit = [agent for agent in agents if not any(agent_load(agent)[:2])]
+    return fit or agents
+
+
+def least_loaded(candidates):
+    """Return the (agent, segment index) of the least loaded agent among candidates.
+
+    Of the segments the agents of a host can bind, the one of a fit agent
+    is preferred, see fit_agents().
+    """
+    return min(candidates, key=lambda candidate: agent_load(candidate[0]))
+
+
+class BindingDecisionCache(object):
+    """Bounded LRU cache of binding decisions.
+
+    A decision is the index of the segment to bind, or None if no segment
+    fits, keyed by device owner, agent type and segments_key(). Decisions do
+    not depend on segment ids, so ports of different networks with the same
+    physical layout share them.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._decisions = collections.OrderedDict()
+
+    def decide(self, key, segments, bindable):
+        """Return the cached decision for key, computing it with bindable on a miss."""
+        if key in self._decisions:
+            self.hits += 1
+            index = self._decisions.pop(key)
+        else:
+            self.misses += 1
+            index = None
+            for i, segment in enumerate(segments):
+                if bindable(segment):
+                    index = i
+                    break
+            if self.size <= 0:
+                return index
+            if len(self._decisions) >= self.size:
+                self._decisions.popitem(last=False)
+
+        self._decisions[key] = index
+        return index
+
+
+class AgentHostIndex(object):
+    """F5 agents by the host they serve, listed at most every ttl seconds.
+
+    Sharded agents report as <host>#<member> and carry the host they serve
+    in their configurations as agent_host, so they are not found by the
+    host of a port. list_agents returns all F5 agents.
+    """
+
+    def __init__(self, ttl, list_agents):
+        self.ttl = ttl
+        self.list_agents = list_agents
+        self.listed = 0
+        self._agents = {}
+
+    def get(self, host):
+        if time.time() - self.listed >= self.ttl:
+            agents = collections.defaultdict(list)
+            for agent in self.list_agents():
+                agent_host = agent['configurations'].get('agent_host')
+                if agent_host:
+                    agents[agent_host].append(agent)
+            self._agents = dict(agents)
+            self.listed = time.time()
+        return self._agents.get(host, [])
@@ -35,7 +35,35 @@ f5_opts = [
 f5_ml2_opts = [cfg.ListOpt('physical_networks', default=None,
                            help=_("List of pyhsical networks the driver should use to"
                                   "indentify the segment to use (if not specified"
-                                  "driver will use first segment in the list)"))]
+                                  "driver will use first segment in the list)")),
+               cfg.IntOpt('binding_cache_size', default=1024,
+                          help=_("Number of port binding decisions cached by the "
+                                 "F5 mechanism drivers, 0 disables the cache")),
+               cfg.IntOpt('agent_cache_ttl', default=10,
+                          help=_("Seconds the F5 mechanism driver caches the "
+                                 "agents of sharded hosts between two agent "
+                                 "queries")),
+               cfg.StrOpt('metrics_sink', default='none',
+                          choices=['none', 'prometheus', 'statsd'],
+                          help=_("Where the F5 mechanism drivers export their binding "
+                                 "timings and counters: a Prometheus text file, a "
+                                 "statsd daemon or nowhere")),
+               cfg.StrOpt('metrics_textfile',
+                          default='/var/lib/node_exporter/textfile_collector/'
+                                  'neutron_f5_ml2_%(pid)d.prom',
+                          help=_("File written by the prometheus metrics sink, "
+                                 "%(pid)d is replaced by the id of the server "
+                                 "worker process")),
+               cfg.IntOpt('metrics_flush_interval', default=60,
+                          help=_("Seconds between two writes of the prometheus "
+                                 "metrics file, checked after every port binding")),
+               cfg.StrOpt('statsd_host', default='localhost',
+                          help=_("Host of the statsd daemon used by the statsd "
+                                 "metrics sink")),
+               cfg.IntOpt('statsd_port', default=8125,
+                          help=_("UDP port of the statsd daemon")),
+               cfg.StrOpt('statsd_prefix', default='neutron.f5_ml2',
+                          help=_("Prefix of all metric names sent to statsd"))]
 
 cfg.CONF.register_opts(f5_opts)
 cfg.CONF.register_opts(f5_ml2_opts, 'ml2_f5')
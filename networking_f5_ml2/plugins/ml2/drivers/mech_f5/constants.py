@@ -21,4 +21,14 @@
 DEFAULT_F5_RESPAWN = 30
 VIF_TYPE_F5 ='f5'
 
-F5_AGENT_TYPE = 'F5 ML2 Agent'
\ No newline at end of file
+F5_AGENT_TYPE = 'F5 ML2 Agent'
+
+F5_DEVICE_OWNER = 'network:f5lbaasv2'
+
+MECH_DRIVER_NAME = 'f5ml2'
+SIMPLE_MECH_DRIVER_NAME = 'simple_f5ml2'
+
+F5_PLUGIN_TOPIC = 'f5-ml2-plugin'
+
+# agents consume F5 notifications on <q-agent-notifier-f5-update>.<agent host>
+F5_AGENT_TOPIC = 'f5'
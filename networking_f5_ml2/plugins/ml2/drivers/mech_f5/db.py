@@ -0,0 +1,76 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.db import models_v2
+from neutron.plugins.ml2 import models as ml2_models
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+
+YIELD_PER = 1000
+
+
+def get_f5_bound_ports(session, host, port_ids=None, marker=None, limit=None):
+    """Return the ports bound by the f5ml2 driver on the given host.
+
+    Each row carries the port id, network id, network tenant and the bound
+    segment's type and segmentation id, so callers never need to look up
+    networks or segments port by port. If port_ids is given only those
+    ports are considered. Rows are ordered by port id; marker and limit
+    select the page of rows following the port id marker. The returned
+    query streams its rows, iterate it only once.
+    """
+    query = session.query(models_v2.Port.id,
+                          models_v2.Port.network_id,
+                          models_v2.Network.tenant_id,
+                          ml2_models.NetworkSegment.network_type,
+                          ml2_models.NetworkSegment.segmentation_id)
+    query = query.join(
+        ml2_models.PortBindingLevel,
+        ml2_models.PortBindingLevel.port_id == models_v2.Port.id)
+    query = query.join(
+        models_v2.Network,
+        models_v2.Network.id == models_v2.Port.network_id)
+    query = query.join(
+        ml2_models.NetworkSegment,
+        ml2_models.NetworkSegment.id == ml2_models.PortBindingLevel.segment_id)
+    query = query.filter(
+        ml2_models.PortBindingLevel.host == host,
+        ml2_models.PortBindingLevel.driver == f5_constants.MECH_DRIVER_NAME)
+    if port_ids is not None:
+        query = query.filter(models_v2.Port.id.in_(port_ids))
+    if marker is not None:
+        query = query.filter(models_v2.Port.id > marker)
+
+    query = query.order_by(models_v2.Port.id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    # rows are fetched from the cursor in chunks while the caller iterates
+    return query.yield_per(YIELD_PER)
+
+
+def get_f5_network_bindings(session, network_id):
+    """Return the distinct (host, network type, segmentation id) f5ml2 ports of a network are bound with."""
+    query = session.query(ml2_models.PortBindingLevel.host,
+                          ml2_models.NetworkSegment.network_type,
+                          ml2_models.NetworkSegment.segmentation_id)
+    query = query.join(
+        ml2_models.NetworkSegment,
+        ml2_models.NetworkSegment.id == ml2_models.PortBindingLevel.segment_id)
+    query = query.filter(
+        ml2_models.NetworkSegment.network_id == network_id,
+        ml2_models.PortBindingLevel.driver == f5_constants.MECH_DRIVER_NAME)
+    return query.distinct().all()
@@ -14,15 +14,23 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
+from neutron import context as n_context
 from neutron.extensions import portbindings
 from neutron.i18n import _LI
+from neutron import manager
 from neutron.plugins.common import constants as p_constants
 
 from neutron.plugins.ml2.drivers import mech_agent
 from neutron.plugins.ml2 import driver_api as api
 from oslo_log import log
 from oslo_config import cfg
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import binding
 from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import metrics
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import notifier
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import rpc as f5_rpc
 
 LOG = log.getLogger(__name__)
 
@@ -30,7 +38,7 @@ cfg.CONF.import_group('ml2_f5',
                       'networking_f5_ml2.plugins.ml2.drivers.mech_f5.config')
 
 
-class F5MechanismDriver(mech_agent.SimpleAgentMechanismDriverBase):
+class F5MechanismDriver(notifier.F5NotifierMixin, mech_agent.SimpleAgentMechanismDriverBase):
     """Binds ports used by the F5 driver.
     """
 
@@ -39,7 +47,10 @@ class F5MechanismDriver(mech_agent.SimpleAgentMechanismDriverBase):
         self.agent_type = f5_constants.F5_AGENT_TYPE
         self.vif_type = f5_constants.VIF_TYPE_F5
         self.vif_details = {portbindings.CAP_PORT_FILTER: False}
-        self.physical_networks = cfg.CONF.ml2_f5.physical_networks
+        self.physical_networks = binding.physnet_index(cfg.CONF.ml2_f5.physical_networks)
+        self.decisions = binding.BindingDecisionCache(cfg.CONF.ml2_f5.binding_cache_size)
+        self.host_agents = binding.AgentHostIndex(cfg.CONF.ml2_f5.agent_cache_ttl, self._list_agents)
+        self.metrics = metrics.driver_registry()
 
         super(F5MechanismDriver, self).__init__(
                 self.agent_type,
@@ -48,25 +59,76 @@ class F5MechanismDriver(mech_agent.SimpleAgentMechanismDriverBase):
 
         LOG.info(_LI("F5 ML2 mechanism driver initialized..."))
 
+    def initialize(self):
+        f5_rpc.register_rpc_listeners()
+        self.notifier = f5_rpc.F5AgentNotifyAPI()
+
     def get_allowed_network_types(self, agent):
         return ([p_constants.TYPE_VLAN])
 
     def get_mappings(self, agent):
-        return agent['configurations'].get('network_maps', {'default': 'default'})
-
-    def try_to_bind_segment_for_agent(self, context, segment, agent):
-        LOG.info(_LI("try_to_bind_segment_for_agent"))
-
-        if segment[api.PHYSICAL_NETWORK] in self.physical_networks:
-
-            if self.check_segment_for_agent(segment, agent):
-                context.set_binding(segment[api.ID],
-                                    self.vif_type,
-                                    self.vif_details)
-                return True
-
-        return False
+        return agent['configurations'].get('network_maps') or {'default': 'default'}
+
+    def bind_port(self, context):
+        start = time.time()
+        outcome = self._bind_port(context)
+        self.metrics.observe('f5_ml2_bind_seconds', time.time() - start, driver=f5_constants.MECH_DRIVER_NAME)
+        self.metrics.inc('f5_ml2_bind_total', driver=f5_constants.MECH_DRIVER_NAME, outcome=outcome)
+        self.metrics.maybe_flush()
+
+    def _bind_port(self, context):
+        vnic_type = context.current.get(portbindings.VNIC_TYPE, portbindings.VNIC_NORMAL)
+        if vnic_type not in self.supported_vnic_types:
+            return 'unsupported_vnic_type'
+
+        segments = context.segments_to_bind
+        key_segments = binding.segments_key(segments)
+        candidates = []
+        for agent in self._get_host_agents(context):
+            if not agent['alive']:
+                continue
+            network_maps = tuple(sorted(agent['configurations'].get('network_maps') or ()))
+            index = self.decisions.decide(
+                (context.current['device_owner'], agent['agent_type'], network_maps, key_segments),
+                segments,
+                lambda segment: self._can_bind_segment_for_agent(segment, agent))
+            if index is not None:
+                candidates.append((agent, index))
+
+        if candidates:
+            agent, index = binding.least_loaded(candidates)
+            LOG.debug("Binding port %(port)s for agent %(host)s with load %(load)s",
+                      {'port': context.current['id'], 'host': agent['host'],
+                       'load': agent['configurations'].get('load')})
+            context.set_binding(segments[index][api.ID],
+                                self.vif_type,
+                                self.vif_details)
+            return 'bound'
+
+        return 'no_segment'
+
+    def _get_host_agents(self, context):
+        agents = context.host_agents(self.agent_type)
+        if agents or context.current['device_owner'] != f5_constants.F5_DEVICE_OWNER:
+            return agents
+
+        # no agent reports as the host, it may be served by sharded agents
+        return self.host_agents.get(context.host)
+
+    def _list_agents(self):
+        plugin = manager.NeutronManager.get_plugin()
+        return plugin.get_agents(n_context.get_admin_context(),
+                                 filters={'agent_type': [self.agent_type]})
+
+    def _can_bind_segment_for_agent(self, segment, agent):
+        # agents reporting network_maps only serve the physical networks mapped there
+        network_maps = agent['configurations'].get('network_maps')
+        return ((self.physical_networks is None or
+                 segment[api.PHYSICAL_NETWORK] in self.physical_networks) and
+                (not network_maps or segment[api.PHYSICAL_NETWORK] in network_maps) and
+                self.check_segment_for_agent(segment, agent))
 
     def check_segment_for_agent(self, segment, agent):
-        LOG.info(_LI("Checking segment for agent " + str(agent) + " " + str(agent['agent_type'])))
+        LOG.debug("Checking segment %(segment)s for agent %(host)s of type %(agent_type)s",
+                  {'segment': segment[api.ID], 'host': agent['host'], 'agent_type': agent['agent_type']})
         return agent['agent_type'] == f5_constants.F5_AGENT_TYPE
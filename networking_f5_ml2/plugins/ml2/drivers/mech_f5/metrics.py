@@ -0,0 +1,287 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import atexit
+import contextlib
+import errno
+import glob
+import os
+import re
+import socket
+import tempfile
+import time
+
+from neutron.i18n import _LE
+from oslo_config import cfg
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, v) for k, v in pairs) + '}'
+
+
+class Counter(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, value=1):
+        self.value += value
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'last')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+
+
+class MetricsRegistry(object):
+    """Counters and latency histograms of the agent and the mechanism drivers, keyed by name and labels.
+
+    Every sample is forwarded to the configured sinks; flush() lets sinks
+    that export snapshots (e.g. a Prometheus text file) write them out.
+    """
+
+    def __init__(self, sinks=(), flush_interval=0):
+        self.sinks = list(sinks)
+        self.flush_interval = flush_interval
+        self.flushed = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = Counter()
+        counter.inc(value)
+        for sink in self.sinks:
+            sink.inc(name, labels, value)
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+        for sink in self.sinks:
+            sink.observe(name, labels, value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time spent in the with block, also if it raises."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def summary(self):
+        """Return a compact dict of all metrics, suitable for the agent state."""
+        summary = {}
+        for (name, labels), counter in self.counters.items():
+            summary[name + _format_labels(labels)] = counter.value
+        for (name, labels), histogram in self.histograms.items():
+            summary[name + _format_labels(labels)] = {
+                'count': histogram.count,
+                'sum': round(histogram.sum, 3),
+                'last': round(histogram.last, 3)}
+        return summary
+
+    def totals(self, name, by):
+        """Aggregate the histograms of name by the value of their label by.
+
+        The size of the result only depends on the values of by, not on
+        other labels like the device, so it fits the agent state.
+        """
+        totals = {}
+        for (n, labels), histogram in self.histograms.items():
+            if n != name:
+                continue
+            total = totals.setdefault(dict(labels).get(by), {'count': 0, 'sum': 0.0, 'last': 0.0})
+            total['count'] += histogram.count
+            total['sum'] += histogram.sum
+            total['last'] = max(total['last'], histogram.last)
+        for total in totals.values():
+            total['sum'] = round(total['sum'], 3)
+            total['last'] = round(total['last'], 3)
+        return totals
+
+    def flush(self):
+        self.flushed = time.time()
+        for sink in self.sinks:
+            try:
+                sink.flush(self)
+            except Exception:
+                LOG.exception(_LE("Failed flushing metrics to %s"), sink)
+
+    def maybe_flush(self):
+        """Flush if flush_interval passed since the last flush, for callers without a loop."""
+        if self.sinks and time.time() - self.flushed >= self.flush_interval:
+            self.flush()
+
+
+class PrometheusTextfileSink(object):
+    """Writes the registry in Prometheus text format, e.g. for the node exporter textfile collector.
+
+    A %(pid)d in path is replaced by the process id, so every neutron-server
+    worker writes a file of its own. A worker removes its file when it exits
+    and, with its first flush, the files of workers which died without.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pid = None
+
+    def _per_process(self):
+        return '%(pid)d' in self.path
+
+    def _remove_file(self, pid):
+        try:
+            os.unlink(self.path % {'pid': pid})
+        except OSError:
+            pass
+
+    def _remove_stale_files(self):
+        pattern = re.compile(re.escape(self.path).replace(re.escape('%(pid)d'), r'(\d+)') + '$')
+        for path in glob.glob(self.path.replace('%(pid)d', '*')):
+            match = pattern.match(path)
+            if match is None or int(match.group(1)) == os.getpid():
+                continue
+            try:
+                os.kill(int(match.group(1)), 0)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    self._remove_file(int(match.group(1)))
+
+    def _started(self):
+        # first flush of this process, sinks are created before neutron-server forks its workers
+        self._pid = os.getpid()
+        if self._per_process():
+            self._remove_stale_files()
+            atexit.register(self._remove_file, self._pid)
+
+    def inc(self, name, labels, value):
+        pass
+
+    def observe(self, name, labels, value):
+        pass
+
+    def flush(self, registry):
+        if self._pid != os.getpid():
+            self._started()
+
+        lines = []
+        for name in sorted(set(name for name, labels in registry.counters)):
+            lines.append('# TYPE %s counter' % name)
+            for (n, labels), counter in sorted(registry.counters.items()):
+                if n == name:
+                    lines.append('%s%s %s' % (name, _format_labels(labels), counter.value))
+
+        for name in sorted(set(name for name, labels in registry.histograms)):
+            lines.append('# TYPE %s histogram' % name)
+            for (n, labels), histogram in sorted(registry.histograms.items()):
+                if n != name:
+                    continue
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append('%s_bucket%s %s' % (name, _format_labels(labels, [('le', bound)]), count))
+                lines.append('%s_bucket%s %s' % (name, _format_labels(labels, [('le', '+Inf')]), histogram.count))
+                lines.append('%s_sum%s %s' % (name, _format_labels(labels), histogram.sum))
+                lines.append('%s_count%s %s' % (name, _format_labels(labels), histogram.count))
+
+        # write atomically, the collector must never see a partial file
+        path = self.path % {'pid': os.getpid()}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+
+
+class StatsdSink(object):
+    """Sends every sample to a statsd daemon over UDP, labels become name components."""
+
+    def __init__(self, host, port, prefix):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, name, labels):
+        parts = [self.prefix, name] + [str(v).replace('.', '_') for k, v in sorted(labels.items())]
+        return '.'.join(p for p in parts if p)
+
+    def _send(self, data):
+        try:
+            self.socket.sendto(data.encode('utf-8'), self.address)
+        except socket.error:
+            # metrics must never break the agent
+            pass
+
+    def inc(self, name, labels, value):
+        self._send('%s:%d|c' % (self._name(name, labels), value))
+
+    def observe(self, name, labels, value):
+        self._send('%s:%d|ms' % (self._name(name, labels), value * 1000))
+
+    def flush(self, registry):
+        pass
+
+
+_driver_registry = None
+
+
+def driver_registry():
+    """The registry shared by the F5 mechanism drivers of a neutron-server process."""
+    global _driver_registry
+    if _driver_registry is None:
+        conf = cfg.CONF.ml2_f5
+        _driver_registry = create_registry(conf, conf.metrics_flush_interval)
+    return _driver_registry
+
+
+def create_registry(conf, flush_interval=0):
+    """Build the registry with the sink selected by the AGENT or ml2_f5 options."""
+    sinks = []
+    if conf.metrics_sink == 'prometheus':
+        sinks.append(PrometheusTextfileSink(conf.metrics_textfile))
+    elif conf.metrics_sink == 'statsd':
+        sinks.append(StatsdSink(conf.statsd_host, conf.statsd_port, conf.statsd_prefix))
+    return MetricsRegistry(sinks, flush_interval)
@@ -0,0 +1,99 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.extensions import providernet
+from neutron.i18n import _LE
+from neutron.plugins.ml2 import driver_api as api
+from oslo_log import log
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import db as f5_db
+
+LOG = log.getLogger(__name__)
+
+
+# network attributes the VLAN of the agents depends on, only their changes are cast
+NETWORK_ATTRIBUTES = ('tenant_id', providernet.NETWORK_TYPE, providernet.SEGMENTATION_ID)
+
+
+def _f5ml2_segment(binding_levels):
+    """Return the segment f5ml2 bound at any level, as db.get_f5_bound_ports() does, or None."""
+    for level in binding_levels or ():
+        if level[api.BOUND_DRIVER] == f5_constants.MECH_DRIVER_NAME:
+            return level[api.BOUND_SEGMENT]
+    return None
+
+
+class F5NotifierMixin(object):
+    """Postcommit hooks of the F5 mechanism driver.
+
+    Changes of ports bound by the f5ml2 driver and their networks are cast
+    to the agents of the binding host as compact records, see
+    F5AgentNotifyAPI. The agents apply them without calling back to the
+    server. Set notifier in initialize().
+    """
+
+    notifier = None
+
+    def _notify(self, method, context, host, payload):
+        try:
+            getattr(self.notifier, method)(context, host, payload)
+        except Exception:
+            # the agent catches up with its next full sync
+            LOG.exception(_LE("Failed casting %(method)s to the F5 agents of %(host)s"),
+                          {'method': method, 'host': host})
+
+    def update_port_postcommit(self, context):
+        if self.notifier is None:
+            return
+
+        port = context.current
+        plugin_context = context._plugin_context
+        original_segment = _f5ml2_segment(context.original_binding_levels)
+        segment = _f5ml2_segment(context.binding_levels)
+        if original_segment and context.original_host and (context.original_host != context.host or
+                                                           not segment):
+            # unbound or moved, the agents of the previous host have to forget it
+            self._notify('f5_port_delete', plugin_context, context.original_host, [port['id']])
+
+        if not segment:
+            return
+        if context.original_host == context.host and original_segment == segment:
+            # nothing the agent cares about changed
+            return
+
+        self._notify('f5_port_update', plugin_context, context.host,
+                     [[port['id'], port['network_id'], context.network.current['tenant_id'],
+                       segment[api.NETWORK_TYPE], segment[api.SEGMENTATION_ID]]])
+
+    def delete_port_postcommit(self, context):
+        if self.notifier is None or not _f5ml2_segment(context.binding_levels) or not context.host:
+            return
+        self._notify('f5_port_delete', context._plugin_context, context.host, [context.current['id']])
+
+    def update_network_postcommit(self, context):
+        if self.notifier is None:
+            return
+
+        network, original = context.current, context.original
+        if all(network.get(key) == original.get(key) for key in NETWORK_ATTRIBUTES):
+            return
+
+        plugin_context = context._plugin_context
+        for host, network_type, segmentation_id in f5_db.get_f5_network_bindings(plugin_context.session,
+                                                                                  network['id']):
+            self._notify('f5_network_update', plugin_context, host,
+                         [network['id'], network['tenant_id'], network_type, segmentation_id])
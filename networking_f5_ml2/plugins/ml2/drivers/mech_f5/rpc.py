@@ -0,0 +1,199 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import functools
+
+from neutron.common import rpc as n_rpc
+from neutron.common import topics
+from neutron.i18n import _LE, _LI
+from neutron import manager
+from oslo_config import cfg
+from oslo_log import log
+import oslo_messaging
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import binding
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import constants as f5_constants
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import db as f5_db
+
+LOG = log.getLogger(__name__)
+
+# Compact record of an F5 bound port, as exchanged by get_f5_ports
+F5Port = collections.namedtuple('F5Port', ['id', 'network_id', 'tenant_id',
+                                           'network_type', 'segmentation_id'])
+
+
+def start_rpc_listeners():
+    """Start consuming the plugin side F5 RPC endpoint, return the RPC servers."""
+    LOG.info(_LI("Starting F5 ML2 RPC listeners on topic %s"), f5_constants.F5_PLUGIN_TOPIC)
+    connection = n_rpc.create_connection(new=True)
+    connection.create_consumer(f5_constants.F5_PLUGIN_TOPIC,
+                               [F5PluginRpcCallback()],
+                               fanout=False)
+    return connection.consume_in_threads()
+
+
+def register_rpc_listeners():
+    """Have the core plugin start the F5 endpoint along with its own RPC listeners.
+
+    Mechanism drivers are initialized in the neutron-server parent process,
+    before the API and RPC workers fork, and AMQP connections must not be
+    shared across a fork. The core plugin's start_rpc_listeners runs in
+    every RPC worker after the fork, so the F5 consumer is started from
+    there. The configured core plugin class is hooked, not Ml2Plugin, so
+    plugins overriding start_rpc_listeners start it as well.
+
+    Returns False, after logging an error, if the plugin cannot be hooked;
+    the F5 agents are not served then.
+    """
+    try:
+        plugin_class = manager.NeutronManager.load_class_for_provider('neutron.core_plugins',
+                                                                      cfg.CONF.core_plugin)
+    except ImportError:
+        LOG.exception(_LE("Failed loading the core plugin %s to start the F5 ML2 RPC "
+                          "listeners with, F5 agents will not be served"), cfg.CONF.core_plugin)
+        return False
+
+    start_plugin_listeners = getattr(plugin_class, 'start_rpc_listeners', None)
+    if start_plugin_listeners is None:
+        LOG.error(_LE("Core plugin %s does not start RPC listeners, the F5 ML2 RPC endpoint "
+                      "is not started and F5 agents will not be served"), plugin_class.__name__)
+        return False
+    if getattr(start_plugin_listeners, 'starts_f5_listeners', False):
+        return True
+
+    @functools.wraps(start_plugin_listeners)
+    def start_listeners(plugin):
+        servers = start_plugin_listeners(plugin) or []
+        return list(servers) + list(start_rpc_listeners())
+
+    start_listeners.starts_f5_listeners = True
+    plugin_class.start_rpc_listeners = start_listeners
+    LOG.info(_LI("F5 ML2 RPC listeners start with those of %s"), plugin_class.__name__)
+    return True
+
+
+class F5PluginRpcCallback(object):
+    """Plugin side RPC callback serving F5 bound ports to the agents."""
+
+    target = oslo_messaging.Target(version='1.1')
+
+    def get_f5_ports(self, context, host, port_ids=None, marker=None, limit=None):
+        """Return a page of ports bound by f5ml2 on host, ordered by port id.
+
+        Each record is a list in F5Port field order, pre-joined with the
+        network tenant and the bound segment. Pass the id of the last record
+        received as marker to get the next page.
+        """
+        return [list(port) for port in f5_db.get_f5_bound_ports(
+            context.session, host, port_ids=port_ids, marker=marker, limit=limit)]
+
+    def get_f5_agents(self, context, host):
+        """Return the hosts of the F5 agents which shall reconcile the ports bound to host.
+
+        These are the live agents serving host, without the unhealthy and
+        overrunning ones as long as another agent is neither, so their
+        networks move to the agents keeping up.
+        """
+        plugin = manager.NeutronManager.get_plugin()
+        agents = plugin.get_agents(context, filters={'agent_type': [f5_constants.F5_AGENT_TYPE]})
+        agents = [agent for agent in agents
+                  if agent['alive'] and agent['configurations'].get('agent_host', agent['host']) == host]
+        return sorted(agent['host'] for agent in binding.fit_agents(agents))
+
+
+class F5PluginApi(object):
+    """Agent side client of F5PluginRpcCallback.
+
+    API version history:
+        1.0 - Initial version, get_f5_ports.
+        1.1 - get_f5_agents.
+    """
+
+    def __init__(self, topic):
+        target = oslo_messaging.Target(topic=topic, version='1.0')
+        self.client = n_rpc.get_client(target)
+
+    def get_f5_agents(self, context, host):
+        cctxt = self.client.prepare(version='1.1')
+        return cctxt.call(context, 'get_f5_agents', host=host)
+
+    def get_f5_ports(self, context, host, port_ids=None, marker=None, limit=None):
+        cctxt = self.client.prepare()
+        try:
+            return cctxt.call(context, 'get_f5_ports', host=host, port_ids=port_ids,
+                              marker=marker, limit=limit)
+        except oslo_messaging.MessagingTimeout:
+            LOG.error(_LE("No F5 ML2 RPC endpoint answered on topic %s, check that the f5ml2 "
+                          "mechanism driver is loaded and its RPC listeners were started "
+                          "by the neutron-server RPC workers"), self.client.target.topic)
+            raise
+
+    def iter_f5_ports(self, context, host, port_ids=None, page_size=500):
+        """Yield the F5 bound ports of host as F5Port, fetching them page by page.
+
+        Only one page is held at a time, so memory does not grow with the
+        number of ports.
+        """
+        if port_ids is not None:
+            port_ids = list(port_ids)
+
+        marker = None
+        while True:
+            rows = self.get_f5_ports(context, host, port_ids=port_ids,
+                                     marker=marker, limit=page_size)
+            for row in rows:
+                yield F5Port(*row)
+
+            if len(rows) < page_size:
+                break
+            marker = rows[-1][0]
+
+
+def f5_agent_topic(host):
+    """Topic the F5 agents serving host consume F5 notifications on."""
+    return '%s.%s' % (topics.get_topic_name(topics.AGENT, f5_constants.F5_AGENT_TOPIC, topics.UPDATE), host)
+
+
+class F5AgentNotifyAPI(object):
+    """Server side client casting compact F5 notifications to the agents of a host.
+
+    Ports and networks are sent as lists in F5Port field order, without the
+    port id for networks, so agents apply them without calling back.
+    Casts are fanned out to all agents of the host, sharded agents pick
+    the networks they own.
+
+    API version history:
+        1.0 - Initial version, f5_port_update, f5_port_delete and
+              f5_network_update.
+    """
+
+    def __init__(self):
+        target = oslo_messaging.Target(version='1.0')
+        self.client = n_rpc.get_client(target)
+
+    def _cast(self, context, host, method, **kwargs):
+        cctxt = self.client.prepare(topic=f5_agent_topic(host), fanout=True)
+        cctxt.cast(context, method, **kwargs)
+
+    def f5_port_update(self, context, host, ports):
+        self._cast(context, host, 'f5_port_update', ports=ports)
+
+    def f5_port_delete(self, context, host, port_ids):
+        self._cast(context, host, 'f5_port_delete', port_ids=port_ids)
+
+    def f5_network_update(self, context, host, network):
+        self._cast(context, host, 'f5_network_update', network=network)
@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 from neutron.plugins.ml2 import driver_api as api
 from neutron.extensions import portbindings
 from neutron.i18n import _LI
@@ -21,6 +23,9 @@ from oslo_config import cfg
 from oslo_log import log
 
 import constants
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import binding
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import metrics
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5 import rpc as f5_rpc
 
 LOG = log.getLogger(__name__)
 
@@ -36,33 +41,48 @@ class F5SimpleMechanismDriver(api.MechanismDriver):
         self.agent_type = constants.F5_AGENT_TYPE
         self.vif_type = constants.VIF_TYPE_F5
         self.vif_details = {portbindings.CAP_PORT_FILTER: False}
-        self.physical_networks = cfg.CONF.ml2_f5.physical_networks
+        self.physical_networks = binding.physnet_index(cfg.CONF.ml2_f5.physical_networks)
+        self.decisions = binding.BindingDecisionCache(cfg.CONF.ml2_f5.binding_cache_size)
+        self.metrics = metrics.driver_registry()
 
         super(F5SimpleMechanismDriver, self).__init__()
 
         LOG.info(_LI("F5 simple mechanism driver initialized."))
 
     def initialize(self):
-        pass
+        f5_rpc.register_rpc_listeners()
 
     def bind_port(self, context):
+        start = time.time()
+        outcome = self._bind_port(context)
+        self.metrics.observe('f5_ml2_bind_seconds', time.time() - start, driver=constants.SIMPLE_MECH_DRIVER_NAME)
+        self.metrics.inc('f5_ml2_bind_total', driver=constants.SIMPLE_MECH_DRIVER_NAME, outcome=outcome)
+        self.metrics.maybe_flush()
+        return outcome == 'bound'
+
+    def _bind_port(self, context):
         device_owner = context.current['device_owner']
-        if device_owner and device_owner == 'network:f5lbaasv2':
+        if device_owner and device_owner == constants.F5_DEVICE_OWNER:
             # bind to first segment if no physical networks are configured
             if self.physical_networks is None:
                 self._set_binding(context, context.segments_to_bind[0])
-                return True
+                return 'bound'
 
             # bind to first segment present in list of physical networks
-            for segment in context.segments_to_bind:
-                if segment[api.PHYSICAL_NETWORK] in self.physical_networks:
-                    self._set_binding(context, segment)
-                    return True
+            segments = context.segments_to_bind
+            index = self.decisions.decide(
+                (device_owner, self.agent_type, binding.segments_key(segments)),
+                segments,
+                lambda segment: segment[api.PHYSICAL_NETWORK] in self.physical_networks)
+            if index is not None:
+                self._set_binding(context, segments[index])
+                return 'bound'
 
             LOG.error("No segment matches the configured physical networks "
                       "%(physical_networks)s",
-                      {'physical_networks': self.physical_networks})
-        return False
+                      {'physical_networks': sorted(self.physical_networks)})
+            return 'no_segment'
+        return 'not_f5'
 
     def _set_binding(self, context, segment):
         context.set_binding(segment[api.ID],
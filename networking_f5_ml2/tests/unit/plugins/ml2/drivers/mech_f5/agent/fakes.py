@@ -0,0 +1,45 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+class FakeClock(object):
+    """Stands in for the time and eventlet modules of the code under test.
+
+    time() only moves when the test advances it or the code sleeps.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def patch_clock(test, module, now=1000.0):
+    """Replace module.time with a FakeClock for the duration of test."""
+    clock = FakeClock(now)
+    original = module.time
+    module.time = clock
+    test.addCleanup(setattr, module, 'time', original)
+    return clock
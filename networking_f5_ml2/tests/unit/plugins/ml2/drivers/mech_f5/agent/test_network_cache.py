@@ -0,0 +1,73 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import network_cache
+from networking_f5_ml2.tests.unit.plugins.ml2.drivers.mech_f5.agent import fakes
+
+INFO = network_cache.NetworkInfo('tenant', 'vlan', 100)
+
+
+class NetworkCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = fakes.patch_clock(self, network_cache)
+        self.cache = network_cache.NetworkCache(size=2, ttl=60)
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('net-1'))
+        self.cache.put('net-1', INFO)
+        self.assertEqual(INFO, self.cache.get('net-1'))
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_ttl(self):
+        self.cache.put('net-1', INFO)
+        self.clock.advance(59)
+        self.assertEqual(INFO, self.cache.get('net-1'))
+        self.clock.advance(1)
+        self.assertIsNone(self.cache.get('net-1'))
+        self.assertEqual(0, len(self.cache))
+
+    def test_put_refreshes_ttl(self):
+        self.cache.put('net-1', INFO)
+        self.clock.advance(50)
+        self.cache.put('net-1', INFO)
+        self.clock.advance(50)
+        self.assertEqual(INFO, self.cache.get('net-1'))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('net-1', INFO)
+        self.cache.put('net-2', INFO)
+        self.cache.get('net-1')
+        self.cache.put('net-3', INFO)
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.get('net-2'))
+        self.assertEqual(INFO, self.cache.get('net-1'))
+        self.assertEqual(INFO, self.cache.get('net-3'))
+
+    def test_invalidate(self):
+        self.cache.put('net-1', INFO)
+        self.cache.invalidate('net-1')
+        self.cache.invalidate('net-2')
+        self.assertIsNone(self.cache.get('net-1'))
+
+    def test_zero_size_disables(self):
+        cache = network_cache.NetworkCache(size=0, ttl=60)
+        cache.put('net-1', INFO)
+        self.assertEqual(0, len(cache))
+        self.assertIsNone(cache.get('net-1'))
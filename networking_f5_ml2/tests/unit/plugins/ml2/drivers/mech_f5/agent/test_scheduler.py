@@ -0,0 +1,71 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import scheduler
+
+
+class AdaptiveSchedulerTestCase(unittest.TestCase):
+
+    def test_delay_subtracts_elapsed(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=80)
+        self.assertEqual(7, pacer.next_delay(3))
+        self.assertEqual(10, pacer.current_interval)
+
+    def test_overrun_doubles_up_to_max(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=30)
+        self.assertEqual(5, pacer.next_delay(15))
+        self.assertEqual(20, pacer.current_interval)
+        pacer.next_delay(25)
+        self.assertEqual(30, pacer.current_interval)
+        pacer.next_delay(100)
+        self.assertEqual(30, pacer.current_interval)
+
+    def test_shrinks_only_with_margin(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=80)
+        pacer.next_delay(15)
+        pacer.next_delay(25)
+        self.assertEqual(40, pacer.current_interval)
+        pacer.next_delay(30)
+        self.assertEqual(40, pacer.current_interval)
+        self.assertEqual(1, pacer.next_delay(19))
+        self.assertEqual(20, pacer.current_interval)
+
+    def test_never_below_interval(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=80)
+        pacer.next_delay(0)
+        self.assertEqual(10, pacer.current_interval)
+
+    def test_jitter_bounds(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=80, jitter=0.1)
+        for i in range(100):
+            self.assertTrue(9 <= pacer.next_delay(0) <= 11)
+
+    def test_min_spacing_follows_backoff(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=80, min_interval=2)
+        self.assertEqual(2, pacer.min_spacing())
+        pacer.next_delay(15)
+        self.assertEqual(4, pacer.min_spacing())
+
+    def test_wait_times_out(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=80)
+        self.assertFalse(pacer.wait(0.01))
+
+    def test_wake_ends_wait(self):
+        pacer = scheduler.AdaptiveScheduler(interval=10, max_interval=80)
+        pacer.wake()
+        self.assertTrue(pacer.wait(5))
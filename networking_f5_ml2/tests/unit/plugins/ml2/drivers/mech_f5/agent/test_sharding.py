@@ -0,0 +1,61 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import sharding
+
+KEYS = ['network-%d' % i for i in range(3000)]
+
+
+def owners(ring):
+    return dict((key, ring.owner(key)) for key in KEYS)
+
+
+class HashRingTestCase(unittest.TestCase):
+
+    def test_single_member_owns_everything(self):
+        ring = sharding.HashRing(['agent-a'])
+        self.assertEqual({'agent-a'}, set(owners(ring).values()))
+
+    def test_owner_is_stable(self):
+        first = owners(sharding.HashRing(['agent-a', 'agent-b']))
+        second = owners(sharding.HashRing(['agent-b', 'agent-a']))
+        self.assertEqual(first, second)
+
+    def test_distribution(self):
+        members = ['agent-a', 'agent-b', 'agent-c']
+        assigned = list(owners(sharding.HashRing(members)).values())
+        for member in members:
+            # a third each, with some slack for the hashing
+            self.assertGreater(assigned.count(member), len(KEYS) * 0.2)
+
+    def test_removing_member_moves_only_its_keys(self):
+        before = owners(sharding.HashRing(['agent-a', 'agent-b', 'agent-c']))
+        after = owners(sharding.HashRing(['agent-a', 'agent-b']))
+        for key in KEYS:
+            if before[key] != 'agent-c':
+                self.assertEqual(before[key], after[key])
+            else:
+                self.assertIn(after[key], ('agent-a', 'agent-b'))
+
+    def test_adding_member_only_takes_keys(self):
+        before = owners(sharding.HashRing(['agent-a', 'agent-b']))
+        after = owners(sharding.HashRing(['agent-a', 'agent-b', 'agent-c']))
+        moved = [key for key in KEYS if before[key] != after[key]]
+        self.assertTrue(moved)
+        for key in moved:
+            self.assertEqual('agent-c', after[key])
@@ -0,0 +1,152 @@
+# Copyright 2016 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from requests import exceptions as requests_exceptions
+
+from networking_f5_ml2.plugins.ml2.drivers.mech_f5.agent import throttle
+from networking_f5_ml2.tests.unit.plugins.ml2.drivers.mech_f5.agent import fakes
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = fakes.patch_clock(self, throttle)
+        self.breaker = throttle.CircuitBreaker(failure_threshold=3, backoff=10, max_backoff=25)
+
+    def _open(self):
+        for i in range(self.breaker.failure_threshold):
+            opened = self.breaker.failure()
+        self.assertTrue(opened)
+
+    def test_stays_closed_below_threshold(self):
+        self.assertFalse(self.breaker.failure())
+        self.assertFalse(self.breaker.failure())
+        self.assertEqual(throttle.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+
+    def test_success_resets_failures(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.breaker.success()
+        self.assertFalse(self.breaker.failure())
+        self.assertEqual(throttle.CLOSED, self.breaker.state)
+
+    def test_opens_at_threshold(self):
+        self._open()
+        self.assertEqual(throttle.OPEN, self.breaker.state)
+        self.assertEqual(1010, self.breaker.retry_at)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_probe_through(self):
+        self._open()
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(throttle.HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_probe_success_closes(self):
+        self._open()
+        self.clock.advance(10)
+        self.breaker.allow()
+        self.breaker.success()
+        self.assertEqual(throttle.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_failure_reopens_with_longer_backoff(self):
+        self._open()
+        self.clock.advance(10)
+        self.breaker.allow()
+        self.assertTrue(self.breaker.failure())
+        self.assertEqual(throttle.OPEN, self.breaker.state)
+        self.assertEqual(self.clock.now + 20, self.breaker.retry_at)
+
+        self.clock.advance(20)
+        self.breaker.allow()
+        self.assertTrue(self.breaker.failure())
+        # capped at max_backoff
+        self.assertEqual(self.clock.now + 25, self.breaker.retry_at)
+
+    def test_success_resets_backoff(self):
+        self._open()
+        self.clock.advance(10)
+        self.breaker.allow()
+        self.breaker.success()
+        self._open()
+        self.assertEqual(self.clock.now + 10, self.breaker.retry_at)
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = fakes.patch_clock(self, throttle)
+        original = throttle.eventlet
+        throttle.eventlet = self.clock
+        self.addCleanup(setattr, throttle, 'eventlet', original)
+
+    def test_burst_is_free(self):
+        bucket = throttle.TokenBucket(rate=2, burst=4)
+        for i in range(4):
+            self.assertEqual(0, bucket.acquire())
+        self.assertEqual([], self.clock.slept)
+
+    def test_waits_for_refill(self):
+        bucket = throttle.TokenBucket(rate=2, burst=4)
+        bucket.acquire(4)
+        self.assertAlmostEqual(0.5, bucket.acquire())
+        self.assertAlmostEqual(1.0, bucket.acquire(2))
+
+    def test_refills_over_time_up_to_burst(self):
+        bucket = throttle.TokenBucket(rate=2, burst=4)
+        bucket.acquire(4)
+        self.clock.advance(1)
+        self.assertEqual(0, bucket.acquire(2))
+        self.clock.advance(100)
+        self.assertEqual(0, bucket.acquire(4))
+        self.assertAlmostEqual(0.5, bucket.acquire())
+
+    def test_count_above_burst_leaves_debt(self):
+        bucket = throttle.TokenBucket(rate=2, burst=4)
+        self.assertEqual(0, bucket.acquire(6))
+        # the two extra tokens plus the next one
+        self.assertAlmostEqual(1.5, bucket.acquire())
+
+    def test_zero_rate_disables(self):
+        bucket = throttle.TokenBucket(rate=0, burst=1)
+        for i in range(10):
+            self.assertEqual(0, bucket.acquire(5))
+        self.assertEqual([], self.clock.slept)
+
+
+class IsDeviceFailureTestCase(unittest.TestCase):
+
+    def _http_error(self, status):
+        response = type('Response', (object,), {'status_code': status})()
+        return requests_exceptions.HTTPError(response=response)
+
+    def test_connection_errors(self):
+        self.assertTrue(throttle.is_device_failure(requests_exceptions.ConnectionError()))
+        self.assertTrue(throttle.is_device_failure(requests_exceptions.Timeout()))
+
+    def test_server_errors(self):
+        self.assertTrue(throttle.is_device_failure(self._http_error(503)))
+        self.assertTrue(throttle.is_device_failure(self._http_error(429)))
+
+    def test_client_errors(self):
+        self.assertFalse(throttle.is_device_failure(self._http_error(404)))
+        self.assertFalse(throttle.is_device_failure(ValueError()))